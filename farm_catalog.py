@@ -0,0 +1,203 @@
+"""
+In memory cache of the species catalog (the vegetables and animals tables) of the farmsim game.
+
+The catalog is read once from the sql database, after which the buy lists and the per kind stats of the crops and
+animals are served from memory. This keeps sqlite out of the per entity and per frame paths.
+
+Changes to the database while the game runs are picked up by Catalog.poll, which is meant to be called every few
+seconds. It only reloads the tables when 'PRAGMA data_version' or the file itself changed and records which kinds
+changed, so every game sharing the catalog can ask for the changes it has not seen yet with Catalog.changes_since.
+"""
+
+# import build in
+import os
+import threading
+
+# import own
+import farm_sql
+
+
+TABLES = ('vegetables', 'animals')
+
+
+class Catalog:
+    def __init__(self, path='farmsim.sql'):
+        """
+        Cache of the vegetables and animals tables of a farmsim database
+
+        :param path: (str) path to the database holding the catalog
+        """
+        self.path = path
+        self._rows = {}
+        self._kinds = {}
+        self._buy_lists = {}
+        self._lock = threading.RLock()
+        self.generation = 0
+        self._changed = {}
+        self._watch = None
+        self._watch_thread = None
+        self._file = None
+        self._data_version = None
+        """
+        self.path: (str) path to the database holding the catalog
+        self._rows: (dict) table name -> list of tuples, all the rows of that table in database order
+        self._kinds: (dict) table name -> dict of KIND -> first row of that kind
+        self._buy_lists: (dict) table name -> list of (KIND, price) tuples in the order the database returns them
+        self._lock: (threading.RLock) held while a missing table is loaded, so a table is only loaded once when it is
+        prewarmed from another thread
+        self.generation: (integer) increases every time a reload finds changed kinds
+        self._changed: (dict) (table, KIND) -> generation in which the kind last changed
+        self._watch: (None) will become the connection used to poll the data version
+        self._watch_thread: (None) will become the id of the thread that opened self._watch, sqlite connections can
+        only be used on the thread that made them
+        self._file: (None) will become a (inode, size, mtime) tuple of the database file at the last poll
+        self._data_version: (None) will become the data version of the database at the last poll
+        """
+
+    def load(self, table=None):
+        """
+        (Re)loads the given table, or all tables, from the database into memory.
+
+        :param table: (str) name of the table to load, None loads all tables
+        """
+        tables = TABLES if table is None else (table,)
+        connection = farm_sql.create_connection(self.path)
+        for name in tables:
+            rows = farm_sql.execute_read_query(connection, 'SELECT * FROM ' + name) or []
+            # queried as such, sqlite may answer it from an index in another order than the rows
+            buy_list = farm_sql.execute_read_query(connection, 'SELECT KIND, price FROM ' + name) or []
+            kinds = {}
+            for row in rows:
+                kinds.setdefault(row[0], row)
+            with self._lock:
+                self._rows[name] = rows
+                self._kinds[name] = kinds
+                self._buy_lists[name] = buy_list
+        connection.close()
+
+    def _table(self, table):
+        """
+        Makes sure the given table is in memory, loading it when needed.
+
+        :param table: (str) name of the table
+        """
+        if table not in self._rows:
+            with self._lock:
+                # checked again, a caller racing the prewarm thread waits for its load instead of loading again
+                if table not in self._rows:
+                    self.load(table)
+
+    def rows(self, table):
+        """
+        :param table: (str) name of the table
+        :return: (list) of tuples with all the rows of the table
+        """
+        self._table(table)
+        return self._rows[table]
+
+    def row(self, table, kind):
+        """
+        Same as the first result of 'SELECT * FROM table WHERE KIND=?'
+
+        :param table: (str) name of the table
+        :param kind: (str) name of the crop or animal
+        :return: (tuple) with the data of the kind, None if the kind is unknown
+        """
+        self._table(table)
+        return self._kinds[table].get(kind)
+
+    def buy_list(self, table):
+        """
+        Same as the result of 'SELECT KIND, price FROM table', in the same order
+
+        :param table: (str) name of the table
+        :return: (list) of (KIND, price) tuples
+        """
+        self._table(table)
+        return list(self._buy_lists[table])
+
+    def _file_signature(self):
+        """
+        :return: (tuple) (inode, size, mtime) of the database file, None if it does not exist
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _modified(self):
+        """
+        Cheap check whether the database may have changed since the last call, the first call always says it did.
+
+        :return: (boolean) the tables need to be reloaded
+        """
+        signature = self._file_signature()
+        thread = threading.get_ident()
+        if signature != self._file or self._watch is None or thread != self._watch_thread:
+            # a new or replaced file, or another polling thread, needs a new connection, its data version starts over
+            if self._watch is not None and thread == self._watch_thread:
+                self._watch.close()
+            self._file = signature
+            self._watch = farm_sql.create_connection(self.path)
+            self._watch_thread = thread
+            self._data_version = farm_sql.execute_read_query(self._watch, 'PRAGMA data_version')
+            return True
+
+        version = farm_sql.execute_read_query(self._watch, 'PRAGMA data_version')
+        if version != self._data_version:
+            self._data_version = version
+            return True
+        return False
+
+    def poll(self):
+        """
+        Reloads the tables when the database changed and records which kinds changed. Cheap when nothing changed, but
+        it does touch the file system and the database, so call it every few seconds and not on every frame.
+
+        :return: (integer) the generation of the catalog
+        """
+        if not self._modified():
+            return self.generation
+
+        for table in TABLES:
+            self._table(table)
+        old = dict(self._kinds)
+        self.load()
+        changed = []
+        for table in TABLES:
+            before = old[table]
+            after = self._kinds[table]
+            for kind in before.keys() | after.keys():
+                if before.get(kind) != after.get(kind):
+                    changed.append((table, kind))
+        if changed:
+            self.generation += 1
+            for key in changed:
+                self._changed[key] = self.generation
+        return self.generation
+
+    def changes_since(self, generation):
+        """
+        :param generation: (integer) generation the caller is up to date with
+        :return: (dict) table -> set of the kinds that changed (or were added or removed) after that generation
+        """
+        changes = {}
+        if generation < self.generation:
+            for (table, kind), changed in self._changed.items():
+                if changed > generation:
+                    changes.setdefault(table, set()).add(kind)
+        return changes
+
+    def prewarm(self):
+        """
+        Loads all the tables on a background thread, e.g. while the display is being initialized.
+
+        :return: (threading.Thread) the started loader thread, join it before relying on the catalog
+        """
+        thread = threading.Thread(target=self.load, name='catalog-prewarm', daemon=True)
+        thread.start()
+        return thread
+
+
+CATALOG = Catalog()
@@ -0,0 +1,203 @@
+"""
+Supply and demand market for the crops, animal products and animals of the farmsim game.
+
+Every sale is recorded for its kind, once per day the market updates the price multipliers of all kinds in one batched
+NumPy computation: the recent supply of a kind is an exponential moving average of the units sold per day, the more it
+is above the demand the lower the price and the other way around. Between the updates the multipliers are cached per
+kind, so a sale or a price lookup is a dict lookup and does not depend on the number of kinds or farms.
+
+One market can be shared by many farms, e.g. all the farms of farm_server. The demand then grows with the number of
+farms and only the owner of the market, the server, updates it; the farms only sell and read the prices.
+
+Usage:
+    python farm_market.py [--farms 1000] [--days 30]
+plays the given number of headless farms on one market and prints the prices of the crops per day.
+"""
+
+# import build in
+import argparse
+import time
+from math import floor
+
+# import other
+import numpy as np
+
+# import own
+import farm_catalog
+
+
+TABLES = ('vegetables', 'products', 'animals')
+"""
+TABLES: (tuple) the markets: harvested crops by crop, animal products by animal and sold animals by animal
+"""
+
+
+class Market:
+    def __init__(self, demand=1.0, elasticity=0.5, memory=7, low=0.25, high=2.0, farms=1, catalog=None):
+        """
+        Market prices of all the kinds of the species catalog.
+
+        :param demand: (float) units of each kind a farm can sell per day at the base price, a dict of (table, KIND) ->
+        units sets it per kind
+        :param elasticity: (float) how strongly the price reacts, price multiplier = (supply / demand) ** -elasticity
+        :param memory: (float) days the sales are remembered, the span of the moving average of the supply
+        :param low: (float) lowest price multiplier
+        :param high: (float) highest price multiplier
+        :param farms: (integer) number of farms selling on the market, see join
+        :param catalog: (farm_catalog.Catalog) catalog with the kinds, None for the game catalog
+        """
+        self.elasticity = elasticity
+        self.decay = 1 - 2 / (memory + 1)
+        self.low = low
+        self.high = high
+        self.farms = farms
+        self.generation = 0
+        self._demand_per_farm = demand
+        self._index = {}
+        self._keys = []
+        self._today = []
+        self._prices = {}
+        self._demand = np.empty(0)
+        self._supply = np.empty(0)
+        self._multiplier = np.empty(0)
+        """
+        self.elasticity: (float) how strongly the price reacts to the supply
+        self.decay: (float) weight of yesterday in the moving average of the supply
+        self.low: (float) lowest price multiplier
+        self.high: (float) highest price multiplier
+        self.farms: (integer) number of farms selling on the market, the demand grows with it
+        self.generation: (integer) increases with every update, so users can tell the prices changed
+        self._demand_per_farm: (float or dict) units per day per farm at the base price
+        self._index: (dict) (table, KIND) -> index into the arrays and lists
+        self._keys: (list) (table, KIND) per index
+        self._today: (list) units sold today per index, a list so a sale does not touch numpy
+        self._prices: (dict) (table, KIND) -> cached price multiplier
+        self._demand: (numpy.ndarray) units per day per farm at the base price per index
+        self._supply: (numpy.ndarray) moving average of the units sold per day per index
+        self._multiplier: (numpy.ndarray) price multiplier per index
+        """
+
+        catalog = catalog or farm_catalog.CATALOG
+        for table, source in (('vegetables', 'vegetables'), ('products', 'animals'), ('animals', 'animals')):
+            for kind, _ in catalog.buy_list(source):
+                self._add((table, kind))
+
+    def _add(self, key):
+        """
+        Adds a kind to the market at the base price, its supply starts at the demand.
+
+        :param key: (tuple) (table, KIND)
+        :return: (integer) index of the kind
+        """
+        index = self._index.get(key)
+        if index is None:
+            index = self._index[key] = len(self._keys)
+            self._keys.append(key)
+            self._today.append(0)
+            demand = self._demand_per_farm
+            if isinstance(demand, dict):
+                demand = demand.get(key, 1.0)
+            self._demand = np.append(self._demand, demand)
+            self._supply = np.append(self._supply, demand * max(self.farms, 1))
+            self._multiplier = np.append(self._multiplier, 1.0)
+            self._prices[key] = 1.0
+        return index
+
+    def join(self):
+        """
+        A farm starts selling on the market. The supply is scaled along with the demand, so the prices do not jump.
+        """
+        self._supply *= max(self.farms + 1, 1) / max(self.farms, 1)
+        self.farms += 1
+
+    def leave(self):
+        """
+        A farm stops selling on the market.
+        """
+        if self.farms > 0:
+            self._supply *= max(self.farms - 1, 1) / max(self.farms, 1)
+            self.farms -= 1
+
+    def multiplier(self, table, kind):
+        """
+        :param table: (str) 'vegetables', 'products' or 'animals'
+        :param kind: (str) name of the crop or animal
+        :return: (float) current price multiplier of the kind, 1.0 for kinds the market does not know yet
+        """
+        return self._prices.get((table, kind), 1.0)
+
+    def sell(self, table, kind, value, units=1):
+        """
+        Records a sale and prices it.
+
+        :param table: (str) 'vegetables', 'products' or 'animals'
+        :param kind: (str) name of the crop or animal
+        :param value: (integer) value of the sale at the base price
+        :param units: (integer) number of units sold, e.g. the crops of a harvest
+        :return: (integer) value of the sale at the market price
+        """
+        key = (table, kind)
+        index = self._index.get(key)
+        if index is None:
+            index = self._add(key)
+        self._today[index] += units
+        return floor(value * self._prices[key])
+
+    def buy_price(self, table, kind, price):
+        """
+        :param table: (str) 'vegetables' or 'animals'
+        :param kind: (str) name of the crop or animal
+        :param price: (integer) catalog price
+        :return: (integer) price at the market, seeds and young animals follow the price of what they grow into
+        """
+        return max(1, floor(price * self._prices.get((table, kind), 1.0)))
+
+    def update(self):
+        """
+        Updates the prices of all kinds with the sales since the last update, once per day.
+        """
+        today = np.array(self._today, dtype=np.float64)
+        self._today = [0] * len(self._keys)
+        self._supply = self._supply * self.decay + today * (1 - self.decay)
+        demand = self._demand * max(self.farms, 1)
+        with np.errstate(divide='ignore'):
+            self._multiplier = np.clip((self._supply / demand) ** -self.elasticity, self.low, self.high)
+        self._prices = dict(zip(self._keys, self._multiplier.tolist()))
+        self.generation += 1
+
+    def prices(self, table):
+        """
+        :param table: (str) 'vegetables', 'products' or 'animals'
+        :return: (dict) KIND -> price multiplier
+        """
+        return {kind: price for (name, kind), price in self._prices.items() if name == table}
+
+
+if __name__ == '__main__':
+    import farm_metrics
+    import main
+
+    parser = argparse.ArgumentParser(description='Play headless farms on one market')
+    parser.add_argument('--farms', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+
+    market = Market(farms=0)
+    farms = []
+    for _ in range(args.farms):
+        farm = main.Game()
+        farm.init_farm()
+        farm.use_market(market, owner=False)
+        market.join()
+        farms.append(farm)
+
+    kinds = list(market.prices('vegetables'))
+    print('day ' + ''.join(f"{kind:>11}" for kind in kinds) + '   update')
+    for day in range(1, args.days + 1):
+        for farm in farms:
+            farm_metrics._play(farm)
+        start = time.perf_counter()
+        market.update()
+        took = time.perf_counter() - start
+        prices = market.prices('vegetables')
+        print(f"{day:3d} " + ''.join(f"{prices[kind]:11.3f}" for kind in kinds) + f" {took * 1e6:6.0f} us")
@@ -0,0 +1,287 @@
+"""
+Memory accounting of the farmsim game per subsystem, based on tracemalloc.
+
+Every traced allocation is attributed to the subsystem of the innermost frame of its traceback that belongs to the game:
+    grid:      the crops and animals in the farm matrix and the simulation modules
+    renderer:  pygame, the font and sprite caches and the drawing methods of the Game
+    db:        farm_sql, sqlite3 and the species catalog, including the fetchall results and buy lists
+    other:     everything else, e.g. the interpreter and libraries while importing
+Pixel data of the pygame surfaces is allocated by SDL, which tracemalloc does not see, so it is estimated from the
+sizes of the cached surfaces and reported separately.
+
+In the game, start it with 'python main.py --memory' and press F9 for a report, each report is compared to the previous
+one. Headless:
+    python farm_memory.py [--rows 100] [--columns 100] [--days 10] [--every 5] [--world]
+fills a farm, plays it and prints a report every few days with the peak of end_day and of saving and loading the farm.
+"""
+
+# import build in
+import argparse
+import ast
+import contextlib
+import os
+import pickle
+import sys
+import tracemalloc
+
+
+SUBSYSTEMS = ('grid', 'renderer', 'db', 'other')
+_FILES = {'farm_state.py': 'grid', 'farm_world.py': 'grid', 'farm_shard.py': 'grid', 'farm_value.py': 'grid',
+          'farm_planner.py': 'grid', 'farm_metrics.py': 'grid', 'farm_sprites.py': 'renderer', 'farm_sql.py': 'db',
+          'farm_catalog.py': 'db'}
+_PACKAGES = {'pygame': 'renderer', 'sqlite3': 'db'}
+_RENDER_FUNCTIONS = {'_import_pygame', '_font_path', 'on_init', 'on_render', 'on_cleanup', 'set_labels', '_highlight',
+                     '_get_label_text', 'det_mouse_pos', 'snapshot'}
+"""
+SUBSYSTEMS: (tuple) names of the subsystems in the order of the report
+_FILES: (dict) module file name -> subsystem
+_PACKAGES: (dict) package directory name -> subsystem
+_RENDER_FUNCTIONS: (set) functions of main.py that belong to the renderer, the others belong to the grid
+"""
+
+_MIB = 1024 * 1024
+
+
+def surface_bytes(game):
+    """
+    :param game: (Game) the game
+    :return: (integer) estimated bytes of pixel data of the display and the cached sprite and tile surfaces
+    """
+    surfaces = []
+    if game._screen is not None:
+        surfaces.append(game._screen)
+    if game._atlas is not None:
+        surfaces.extend(game._atlas._sprites.values())
+        surfaces.extend(game._atlas._tiles.values())
+    return sum(s.get_width() * s.get_height() * s.get_bytesize() for s in surfaces)
+
+
+class MemoryMonitor:
+    def __init__(self, frames=16):
+        """
+        Starts tracing the allocations, unless tracemalloc is already tracing. Start it as early as possible, memory
+        allocated before is not seen.
+
+        :param frames: (integer) number of frames stored per traceback, more frames attribute more precisely
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.history = []
+        self.peaks = {}
+        self.peak = 0
+        self._last = None
+        self._previous = None
+        self._main_functions = None
+        self._subsystem_cache = {}
+        """
+        self.history: (list) of (label, dict of subsystem -> [bytes, blocks], surface bytes) per snapshot
+        self.peaks: (dict) label -> [runs, highest extra memory during a run, highest traced memory, total growth] of
+        the code measured with that label
+        self.peak: (integer) highest traced memory seen by measure and snapshot
+        self._last: (None) will become the tracemalloc.Snapshot of the last snapshot
+        self._previous: (None) will become the tracemalloc.Snapshot before the last one, to compare the last one to
+        self._main_functions: (None) will become a list with the function name per line of main.py
+        self._subsystem_cache: (dict) traceback -> subsystem
+        """
+
+    @staticmethod
+    def stop():
+        """
+        Stops tracing the allocations.
+        """
+        tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def measure(self, label):
+        """
+        Context manager recording the peak memory of the code it runs, e.g. an end_day or saving the farm.
+
+        :param label: (str) name of the measured code
+        """
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            after, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            record = self.peaks.setdefault(label, [0, 0, 0, 0])
+            record[0] += 1
+            record[1] = max(record[1], peak - before)
+            record[2] = max(record[2], peak)
+            record[3] += after - before
+
+    def _main_function(self, filename, lineno):
+        """
+        :return: (str) name of the function of main.py holding the given line
+        """
+        if self._main_functions is None:
+            with open(filename) as file:
+                tree = ast.parse(file.read())
+            functions = [''] * (max(node.lineno for node in ast.walk(tree) if hasattr(node, 'lineno')) + 2)
+            for node in ast.walk(tree):
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    for line in range(node.lineno, node.end_lineno + 1):
+                        functions[line] = node.name
+            self._main_functions = functions
+        if lineno < len(self._main_functions):
+            return self._main_functions[lineno]
+        return ''
+
+    def _subsystem(self, traceback):
+        """
+        :param traceback: (tracemalloc.Traceback) traceback of an allocation
+        :return: (str) subsystem of the innermost frame that belongs to the game
+        """
+        subsystem = self._subsystem_cache.get(traceback)
+        if subsystem is not None:
+            return subsystem
+        subsystem = 'other'
+        for frame in reversed(traceback):
+            filename = frame.filename
+            name = os.path.basename(filename)
+            if name == 'main.py':
+                function = self._main_function(filename, frame.lineno)
+                subsystem = 'renderer' if function in _RENDER_FUNCTIONS else 'grid'
+                break
+            if name in _FILES:
+                subsystem = _FILES[name]
+                break
+            package = os.path.basename(os.path.dirname(filename))
+            if package in _PACKAGES:
+                subsystem = _PACKAGES[package]
+                break
+        self._subsystem_cache[traceback] = subsystem
+        return subsystem
+
+    def attribute(self, snapshot):
+        """
+        :param snapshot: (tracemalloc.Snapshot) snapshot to attribute
+        :return: (dict) subsystem -> [bytes, blocks]
+        """
+        totals = {name: [0, 0] for name in SUBSYSTEMS}
+        for statistic in snapshot.statistics('traceback'):
+            total = totals[self._subsystem(statistic.traceback)]
+            total[0] += statistic.size
+            total[1] += statistic.count
+        return totals
+
+    def snapshot(self, label, game=None):
+        """
+        Takes a snapshot of the traced memory and attributes it to the subsystems.
+
+        :param label: (str) name of the snapshot, e.g. 'day 3'
+        :param game: (Game) game whose surfaces are estimated, None to skip them
+        :return: (dict) subsystem -> [bytes, blocks]
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                                              tracemalloc.Filter(False, __file__)))
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        totals = self.attribute(snapshot)
+        self._previous, self._last = self._last, snapshot
+        self.history.append((label, totals, surface_bytes(game) if game else 0))
+        return totals
+
+    def report(self, file=None, growth=10):
+        """
+        Prints the memory per subsystem of the last snapshot, the peaks of the measured code and the growth since the
+        snapshot before.
+
+        :param file: (file) to print to, sys.stdout when None
+        :param growth: (integer) number of source lines with the most growth to print
+        """
+        file = file or sys.stdout
+        if not self.history:
+            print('no memory snapshot taken', file=file)
+            return
+        label, totals, surfaces = self.history[-1]
+        current, peak = tracemalloc.get_traced_memory()
+        print(f"memory at '{label}': traced {current / _MIB:.2f} MiB, peak {max(self.peak, peak) / _MIB:.2f} MiB",
+              file=file)
+        for name in SUBSYSTEMS:
+            size, count = totals[name]
+            print(f"  {name:<10}{size / _MIB:10.2f} MiB {count:10d} blocks", file=file)
+        untraced = current - sum(size for size, _ in totals.values())
+        print(f"  {'monitor':<10}{untraced / _MIB:10.2f} MiB (the monitor itself and changes since the snapshot)",
+              file=file)
+        if surfaces:
+            print(f"  {'surfaces':<10}{surfaces / _MIB:10.2f} MiB (SDL pixel data, not traced)", file=file)
+
+        if self.peaks:
+            print('peaks:', file=file)
+            for name, (runs, extra, highest, total) in self.peaks.items():
+                print(f"  {name:<10}{runs:6d} runs, up to {extra / _MIB:.2f} MiB extra, highest {highest / _MIB:.2f} "
+                      f"MiB, grew {total / _MIB:+.2f} MiB", file=file)
+
+        if self._previous is not None:
+            before_label, before, _ = self.history[-2]
+            print(f"compared to '{before_label}':", file=file)
+            for name in SUBSYSTEMS:
+                print(f"  {name:<10}{(totals[name][0] - before[name][0]) / _MIB:+10.2f} MiB "
+                      f"{totals[name][1] - before[name][1]:+10d} blocks", file=file)
+            for statistic in self._last.compare_to(self._previous, 'lineno')[:growth]:
+                if statistic.size_diff <= 0:
+                    break
+                frame = statistic.traceback[0]
+                print(f"  {statistic.size_diff / 1024:+10.1f} KiB {statistic.count_diff:+8d} blocks "
+                      f"{frame.filename}:{frame.lineno}", file=file)
+
+
+def _save_load(game, monitor, path):
+    """
+    Saves and loads the farm to a file with pickle, measuring both.
+
+    :param game: (Game) the game
+    :param monitor: (MemoryMonitor) the monitor
+    :param path: (str) path of the file
+    """
+    with monitor.measure('save'):
+        if hasattr(game._mtr, 'flush'):
+            game._mtr.flush()
+        else:
+            with open(path, 'wb') as file:
+                pickle.dump(game._mtr, file, pickle.HIGHEST_PROTOCOL)
+    with monitor.measure('load'):
+        if not hasattr(game._mtr, 'flush'):
+            with open(path, 'rb') as file:
+                game._mtr = pickle.load(file)
+            game._revalue_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play a filled farm headless and report its memory per subsystem')
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--columns', type=int, default=100)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--every', type=int, default=5)
+    parser.add_argument('--world', action='store_true', help='store the farm in farmworld.sql, see farm_world')
+    args = parser.parse_args()
+
+    monitor = MemoryMonitor()
+    # imported after tracing started, so the catalog and the modules themselves are accounted for
+    import farm_shard
+    import farm_world
+    import main
+
+    farm = main.Game()
+    farm._ROWS, farm._COLUMNS = args.rows, args.columns
+    farm.init_farm()
+    if args.world:
+        farm.use_world_store(farm_world.PagedGrid(args.rows, args.columns, world='memory'))
+    farm_shard._fill(farm)
+    farm._revalue_all()
+    farm.monitor_memory(monitor)
+    monitor.snapshot('day 0')
+    monitor.report()
+
+    for day in range(1, args.days + 1):
+        farm.end_day()
+        if day % args.every == 0 or day == args.days:
+            _save_load(farm, monitor, 'farmmemory.pickle')
+            monitor.snapshot(f"day {day}")
+            print()
+            monitor.report()
+    if args.world:
+        farm._mtr.close()
+    elif os.path.exists('farmmemory.pickle'):
+        os.remove('farmmemory.pickle')
@@ -0,0 +1,238 @@
+"""
+Per day metrics of a farm, recorded at each Game.end_day into columns of a NumPy array.
+
+The array grows by doubling, so recording a day is amortized constant time and does not create Python objects per day.
+The columns can be exported in bulk to .npz or .csv and queried downsampled, e.g. the mean money per 100 days over a run
+of 100000 days.
+
+Usage:
+    python farm_metrics.py [--days 100000] [--out metrics.npz]
+plays a farm headless for the given number of days and records it.
+"""
+
+# import build in
+import argparse
+import time
+
+# import other
+import numpy as np
+
+# import own
+import farm_shard
+import main
+
+
+COLUMNS = ('day', 'money', 'farm_value',
+           'planted', 'growing', 'harvest', 'dead_crops',
+           'youngster', 'adult', 'produce', 'dead_animals',
+           'quality', 'happiness')
+"""
+COLUMNS: (tuple) names of the recorded columns, quality and happiness are the averages over the living crops and
+animals, NaN when there are none; the farm value is NaN on the days ended in the sharded mode, see _record_sharded
+"""
+
+
+class MetricsRecorder:
+    def __init__(self, capacity=1024):
+        """
+        Columnar recorder of per day metrics.
+
+        :param capacity: (integer) number of days to make room for at the start
+        """
+        self.size = 0
+        self._data = np.empty((len(COLUMNS), max(1, capacity)))
+        self._index = {name: i for i, name in enumerate(COLUMNS)}
+        """
+        self.size: (integer) number of recorded days
+        self._data: (numpy.ndarray) a row per column and a column per day, only the first size days are used
+        self._index: (dict) column name -> row of self._data
+        """
+
+    def _grow(self):
+        """
+        Doubles the room for days.
+        """
+        data = np.empty((len(COLUMNS), self._data.shape[1] * 2))
+        data[:, :self.size] = self._data[:, :self.size]
+        self._data = data
+
+    def record(self, game):
+        """
+        Records the metrics of the day the game is at.
+
+        :param game: (Game) the game
+        """
+        if isinstance(game._mtr, farm_shard.ShardedGrid):
+            self._record_sharded(game)
+            return
+        planted = growing = harvest = dead_crops = 0
+        youngster = adult = produce = dead_animals = 0
+        quality = happiness = 0.0
+        for rows in game._mtr:
+            for tile in rows:
+                if isinstance(tile, main.Vegetable):
+                    if tile.dead:
+                        dead_crops += 1
+                        continue
+                    if tile.days_grown == 0:
+                        planted += 1
+                    elif tile.harvest:
+                        harvest += 1
+                    else:
+                        growing += 1
+                    quality += tile._quality
+                elif isinstance(tile, main.Animal):
+                    if tile.dead:
+                        dead_animals += 1
+                        continue
+                    if tile.harvest and tile.adult:
+                        produce += 1
+                    elif tile.adult:
+                        adult += 1
+                    else:
+                        youngster += 1
+                    happiness += tile._happy
+
+        if self.size == self._data.shape[1]:
+            self._grow()
+        crops = planted + growing + harvest
+        animals = youngster + adult + produce
+        self._data[:, self.size] = (game._day, game._money, game.farm_value(),
+                                    planted, growing, harvest, dead_crops,
+                                    youngster, adult, produce, dead_animals,
+                                    quality / crops if crops else np.nan,
+                                    happiness / animals if animals else np.nan)
+        self.size += 1
+
+    def _record_sharded(self, game):
+        """
+        Records the metrics of a game in the sharded mode from the packed state in shared memory, without touching the
+        crops and animals, which would unpack the whole farm and pack it again the next day. The farm value is only
+        recorded when it is known, determining it would unpack the farm as well.
+
+        :param game: (Game) the game
+        """
+        grid = game._mtr
+        grid.pack_changes()
+        state = grid.state
+        col = farm_shard.COL
+        kind = state[:, col['type']]
+        dead = state[:, col['dead']] == 1
+        harvest = state[:, col['harvest']] == 1
+
+        crops = (kind == farm_shard.VEGETABLE) & ~dead
+        planted = crops & (state[:, col['days_grown']] == 0)
+        ready = crops & ~planted & harvest
+        animals = (kind == farm_shard.ANIMAL) & ~dead
+        adult = animals & (state[:, col['adult']] == 1)
+        produce = adult & harvest
+        counts = (np.count_nonzero(crops), np.count_nonzero(animals))
+
+        if self.size == self._data.shape[1]:
+            self._grow()
+        self._data[:, self.size] = (game._day, game._money,
+                                    np.nan if game._farm_value is None else game._farm_value,
+                                    np.count_nonzero(planted), counts[0] - np.count_nonzero(planted | ready),
+                                    np.count_nonzero(ready),
+                                    np.count_nonzero((kind == farm_shard.VEGETABLE) & dead),
+                                    counts[1] - np.count_nonzero(adult), np.count_nonzero(adult & ~produce),
+                                    np.count_nonzero(produce), np.count_nonzero((kind == farm_shard.ANIMAL) & dead),
+                                    state[crops, col['quality']].mean() if counts[0] else np.nan,
+                                    state[animals, col['happy']].mean() if counts[1] else np.nan)
+        self.size += 1
+
+    def column(self, name):
+        """
+        :param name: (str) name of the column
+        :return: (numpy.ndarray) view on the recorded values of the column
+        """
+        return self._data[self._index[name], :self.size]
+
+    def query(self, name, start=0, stop=None, points=1000, how='mean'):
+        """
+        Gets a column downsampled to at most the given number of points, each point covers a bucket of days.
+
+        :param name: (str) name of the column
+        :param start: (integer) index of the first recorded day
+        :param stop: (integer) index after the last recorded day, None for all
+        :param points: (integer) maximum number of points
+        :param how: (str) 'mean', 'min', 'max' or 'last' value of each bucket
+        :return: (tuple) of numpy arrays with the first day of each bucket and its value
+        """
+        values = self.column(name)[start:stop]
+        days = self.column('day')[start:stop]
+        if not len(values):
+            return days, values
+        step = -(-len(values) // points)
+        starts = np.arange(0, len(values), step)
+        if how == 'mean':
+            counts = np.diff(np.append(starts, len(values)))
+            result = np.add.reduceat(values, starts) / counts
+        elif how == 'min':
+            result = np.minimum.reduceat(values, starts)
+        elif how == 'max':
+            result = np.maximum.reduceat(values, starts)
+        elif how == 'last':
+            result = values[np.append(starts[1:], len(values)) - 1]
+        else:
+            raise ValueError(f"unknown downsampling '{how}'")
+        return days[starts], result
+
+    def to_npz(self, path):
+        """
+        :param path: (str) path of the .npz file, one array per column
+        """
+        np.savez(path, **{name: self.column(name) for name in COLUMNS})
+
+    def to_csv(self, path):
+        """
+        :param path: (str) path of the .csv file, one line per day
+        """
+        np.savetxt(path, self._data[:, :self.size].T, delimiter=',', header=','.join(COLUMNS), comments='',
+                   fmt='%.10g')
+
+    @classmethod
+    def from_npz(cls, path):
+        """
+        :param path: (str) path of a .npz file made by to_npz
+        :return: (MetricsRecorder) with the recorded days
+        """
+        with np.load(path) as data:
+            size = len(data['day'])
+            recorder = cls(size)
+            for name in COLUMNS:
+                recorder._data[recorder._index[name], :size] = data[name]
+        recorder.size = size
+        return recorder
+
+
+def _play(game):
+    """
+    A simple player for the headless run: clicks every tile once a day, buying, watering, harvesting and feeding.
+    """
+    for y in range(game._ROWS):
+        for x in range(game._COLUMNS):
+            game.execute('action', (x, y))
+    game.execute('end_day')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play a farm headless and record its metrics')
+    parser.add_argument('--days', type=int, default=100000)
+    parser.add_argument('--out', default='metrics.npz')
+    args = parser.parse_args()
+
+    farm = main.Game()
+    farm.init_farm()
+    recorder = MetricsRecorder()
+    farm.record_metrics(recorder)
+    took = time.perf_counter()
+    for _ in range(args.days):
+        _play(farm)
+    took = time.perf_counter() - took
+
+    recorder.to_npz(args.out)
+    print(f"played and recorded {recorder.size} days in {took:.2f} s, saved to {args.out}")
+    days, money = recorder.query('money', points=10)
+    for day, value in zip(days, money):
+        print(f"  from day {day:8.0f}: mean money {value:12.1f}")
@@ -0,0 +1,293 @@
+"""
+Planner for the most profitable use of a farm over a fixed number of days.
+
+For every kind in the species catalog a profit curve is made by playing it with the Vegetable and Animal rules: a crop
+is watered every day and harvested as soon as possible, an animal is fed and petted every day, its products are
+collected and it is sold after a number of days. Only the holding times that earn more than every shorter holding time
+of that kind are kept.
+
+A tile is then planned with dynamic programming over (tile type, day, budget), where on each day the tile either stays
+empty or a kind is bought and held for one of its holding times. The budget only matters for which kinds can be bought,
+so it is rounded down to the nearest buy price, which keeps the number of budget states small and the plan on the safe
+side. The farm plan splits the starting money over the tiles, after their first purchase each tile pays for itself.
+
+Usage:
+    python farm_planner.py [--rows 3] [--columns 4] [--days 365] [--budget 1000] [--tile-type any]
+"""
+
+# import build in
+import argparse
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+# import own
+import farm_catalog
+import main
+
+
+TILE_TYPES = {'vegetables': ('vegetables',), 'animals': ('animals',), 'any': ('vegetables', 'animals')}
+
+Curve = namedtuple('Curve', ['table', 'kind', 'price', 'holds'])
+"""
+Profit curve of a kind:
+    table: (str) 'vegetables' or 'animals'
+    kind: (str) name of the crop or animal
+    price: (integer) buy price
+    holds: (list) of (days, revenue) tuples, the money earned when the tile is used for that many days
+"""
+
+Step = namedtuple('Step', ['tile', 'day', 'kind', 'days', 'profit'])
+"""
+One purchase of a plan:
+    tile: (tuple) (column, row) of the tile
+    day: (integer) day the kind is bought, relative to the start of the plan
+    kind: (str) name of the crop or animal
+    days: (integer) number of days the tile is used, on the last day it is harvested or sold and free again
+    profit: (integer) revenue minus the buy price
+"""
+
+
+def vegetable_curve(row, max_days):
+    """
+    Plays a crop that is watered every day and harvested as soon as possible.
+
+    :param row: (tuple) row of the vegetables table
+    :param max_days: (integer) maximum number of days to play
+    :return: (list) of (days, revenue) tuples, for every day the crop was harvested
+    """
+    crop = main.Vegetable(row[0])
+    holds = []
+    revenue = 0
+    for day in range(max_days + 1):
+        if crop.dead:
+            break
+        if crop.harvest:
+            crop.harvest_crop()
+            revenue += crop.value
+            holds.append((day, revenue))
+        if not crop.dead:
+            crop.water()
+            crop.end_day()
+    return holds
+
+
+def animal_curve(row, max_days):
+    """
+    Plays an animal that is fed and petted every day and whose products are collected.
+
+    :param row: (tuple) row of the animals table
+    :param max_days: (integer) maximum number of days to play
+    :return: (list) of (days, revenue) tuples, for every day the animal could be sold
+    """
+    animal = main.Animal(row[0])
+    holds = []
+    revenue = 0
+    for day in range(max_days + 1):
+        if animal.dead:
+            break
+        if animal.harvest:
+            revenue += animal.get_produce()
+        if day:
+            holds.append((day, revenue + animal.sell()))
+        animal.feed()
+        animal.pet()
+        animal.end_day()
+    return holds
+
+
+def curves(max_days, catalog=None):
+    """
+    Makes the profit curves of all kinds in the catalog.
+
+    :param max_days: (integer) maximum number of days a kind can be held
+    :param catalog: (farm_catalog.Catalog) catalog to use, None for the default one
+    :return: (list) of Curve
+    """
+    catalog = catalog or farm_catalog.CATALOG
+    result = []
+    for table, play in (('vegetables', vegetable_curve), ('animals', animal_curve)):
+        seen = set()
+        for row in catalog.rows(table):
+            if row[0] in seen:
+                continue
+            seen.add(row[0])
+            holds = []
+            best = row[1]
+            for days, revenue in play(row, max_days):
+                # a longer hold is only worth it when it earns more than every shorter one
+                if revenue > best:
+                    holds.append((days, revenue))
+                    best = revenue
+            if holds:
+                result.append(Curve(table, row[0], row[1], holds))
+    return result
+
+
+class Planner:
+    def __init__(self, days, catalog=None):
+        """
+        Plans the use of tiles over the given number of days.
+
+        :param days: (integer) number of days to plan
+        :param catalog: (farm_catalog.Catalog) catalog to use, None for the default one
+        """
+        self.days = days
+        self.curves = curves(days, catalog)
+        self._levels = sorted({0} | {curve.price for curve in self.curves})
+        self._memo = {}
+        """
+        self.days: (integer) number of days to plan
+        self.curves: (list) of Curve of every kind that can make a profit
+        self._levels: (list) the budgets that matter, every distinct buy price and 0
+        self._memo: (dict) tile type -> (profit, choice) tables by [day][budget level]
+        """
+
+    def level(self, budget):
+        """
+        :param budget: (integer) money available
+        :return: (integer) index of the highest budget level that is not more than the budget
+        """
+        return max(0, bisect_right(self._levels, budget) - 1)
+
+    def _tables(self, tile_type):
+        """
+        Fills the dynamic programming tables of a tile type, from the last day back to the first.
+
+        :param tile_type: (str) 'vegetables', 'animals' or 'any'
+        :return: (tuple) of the profit and choice tables by [day][budget level]
+        """
+        if tile_type in self._memo:
+            return self._memo[tile_type]
+
+        options = [curve for curve in self.curves if curve.table in TILE_TYPES[tile_type]]
+        levels = len(self._levels)
+        top = self._levels[-1]
+        profit = [[0] * levels for _ in range(self.days + 1)]
+        choice = [[None] * levels for _ in range(self.days + 1)]
+        for day in range(self.days - 1, -1, -1):
+            left = self.days - day
+            for level in range(levels):
+                budget = self._levels[level]
+                best = profit[day + 1][level]
+                best_choice = None
+                for curve in options:
+                    if curve.price > budget:
+                        continue
+                    for days, revenue in curve.holds:
+                        if days > left:
+                            break
+                        after = self.level(min(top, budget - curve.price + revenue))
+                        value = revenue - curve.price + profit[day + days][after]
+                        if value > best:
+                            best = value
+                            best_choice = (curve, days, revenue, after)
+                profit[day][level] = best
+                choice[day][level] = best_choice
+
+        self._memo[tile_type] = (profit, choice)
+        return profit, choice
+
+    def tile_profit(self, tile_type, budget):
+        """
+        :param tile_type: (str) 'vegetables', 'animals' or 'any'
+        :param budget: (integer) money available for the tile at the start
+        :return: (integer) the highest profit the tile can make
+        """
+        return self._tables(tile_type)[0][0][self.level(budget)]
+
+    def tile_plan(self, tile_type, budget, tile=(0, 0)):
+        """
+        :param tile_type: (str) 'vegetables', 'animals' or 'any'
+        :param budget: (integer) money available for the tile at the start
+        :param tile: (tuple) (column, row) of the tile, only used to label the steps
+        :return: (list) of Step, the purchases of the most profitable plan
+        """
+        choice = self._tables(tile_type)[1]
+        steps = []
+        day = 0
+        level = self.level(budget)
+        while day < self.days:
+            picked = choice[day][level]
+            if picked is None:
+                day += 1
+                continue
+            curve, days, revenue, level = picked
+            steps.append(Step(tile, day, curve.kind, days, revenue - curve.price))
+            day += days
+        return steps
+
+    def farm_plan(self, tile_types, budget):
+        """
+        Splits the starting money over the tiles so the total profit is the highest and plans every tile.
+
+        :param tile_types: (list) of rows with the tile type of every tile
+        :param budget: (integer) money available at the start
+        :return: (tuple) of the total profit and a list with the Step lists of every tile
+        """
+        tiles = [((x, y), tile_type) for y, row in enumerate(tile_types) for x, tile_type in enumerate(row)]
+        counts = {}
+        for pos, tile_type in tiles:
+            counts[tile_type] = counts.get(tile_type, 0) + 1
+
+        # knapsack over the tiles of each type by the money left, a tile only needs one of the budget levels and the
+        # tiles of a type are interchangeable; a state is only kept when it earns more than every state with more money
+        # left, each layer holds money left -> (total, money left before, share) as back-pointer
+        layers = [{budget: (0, None, None)}]
+        for tile_type, count in counts.items():
+            shares = []
+            for share in self._levels:
+                profit = self.tile_profit(tile_type, share)
+                if not shares or profit > shares[-1][1]:
+                    shares.append((share, profit))
+            for _ in range(count):
+                after = {}
+                for left, (total, _, _) in layers[-1].items():
+                    for share, profit in shares:
+                        if share > left:
+                            break
+                        rest = left - share
+                        if rest not in after or after[rest][0] < total + profit:
+                            after[rest] = (total + profit, left, share)
+                front = {}
+                best = None
+                for rest in sorted(after, reverse=True):
+                    if best is None or after[rest][0] > best:
+                        best = after[rest][0]
+                        front[rest] = after[rest]
+                layers.append(front)
+
+        left = max(layers[-1], key=lambda rest: layers[-1][rest][0])
+        total = layers[-1][left][0]
+        picked = {tile_type: [] for tile_type in counts}
+        types = [tile_type for tile_type, count in counts.items() for _ in range(count)]
+        for layer, tile_type in zip(reversed(layers[1:]), reversed(types)):
+            _, left, share = layer[left]
+            picked[tile_type].append(share)
+        plans = [self.tile_plan(tile_type, picked[tile_type].pop(), pos) for pos, tile_type in tiles]
+        return total, plans
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Plan the most profitable use of the farm')
+    parser.add_argument('--rows', type=int, default=3)
+    parser.add_argument('--columns', type=int, default=4)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--budget', type=int, default=1000)
+    parser.add_argument('--tile-type', choices=sorted(TILE_TYPES), default='any')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    planner = Planner(args.days)
+    types = [[args.tile_type] * args.columns for _ in range(args.rows)]
+    total_profit, farm = planner.farm_plan(types, args.budget)
+    took = time.perf_counter() - start
+
+    for plan in farm:
+        if plan:
+            kinds = {}
+            for step in plan:
+                kinds[step.kind] = kinds.get(step.kind, 0) + 1
+            summary = ', '.join(f"{kind} x{count}" for kind, count in kinds.items())
+            print(f"tile {plan[0].tile}: first {plan[0].kind} on day {plan[0].day}, "
+                  f"profit {sum(step.profit for step in plan)} ({summary})")
+    print(f"total profit over {args.days} days: {total_profit} (planned in {took:.2f} s)")
@@ -0,0 +1,184 @@
+"""
+Reproducible random yields of the crops, drawn from a counter-based random generator.
+
+Philox4x32-10 turns a counter and a key into random numbers without any state in between, so the random number of a
+tile on a day is a pure function of (seed, day, tile). It does not matter in which order or in which process the tiles
+are drawn: the serial Game.end_day, the sharded end of day of farm_shard and a multi day fast forward all draw the same
+yields. A shard draws for its own tiles only by offsetting the tile numbers by the start of the shard. All the tiles of
+a day are drawn in one vectorized call.
+
+Usage:
+    python farm_random.py [--rows 200] [--columns 200] [--days 30] [--seed 7]
+checks the generator against the known answers of the Random123 reference and that a seeded farm ends up the same
+after the serial, sharded and fast forwarded end of day.
+"""
+
+# import build in
+import argparse
+import time
+
+# import other
+import numpy as np
+
+
+_M0, _M1 = 0xD2511F53, 0xCD9E8D57
+_W0, _W1 = 0x9E3779B9, 0xBB67AE85
+_MASK = 0xFFFFFFFF
+_ROUNDS = 10
+"""
+_M0, _M1: (integer) Philox4x32 multipliers
+_W0, _W1: (integer) Philox4x32 key increments per round (Weyl sequence)
+_MASK: (integer) the lower 32 bits
+_ROUNDS: (integer) number of rounds, 10 is the reference Philox4x32-10
+"""
+
+STREAM_YIELD = 0
+"""
+STREAM_YIELD: (integer) third counter word of the draws of the crop yields, other uses of randomness take another
+stream so they never overlap
+"""
+
+
+def philox(counter, key):
+    """
+    Philox4x32-10 block function, vectorized over the counters.
+
+    :param counter: (tuple) of 4 numpy arrays (or integers) with the 32 bit words of the counters
+    :param key: (tuple) of 2 integers with the 32 bit words of the key
+    :return: (tuple) of 4 numpy uint64 arrays with the 32 bit random words
+    """
+    c0, c1, c2, c3 = (np.asarray(word, dtype=np.uint64) & _MASK for word in counter)
+    k0, k1 = key
+    m0 = np.uint64(_M0)
+    m1 = np.uint64(_M1)
+    mask = np.uint64(_MASK)
+    shift = np.uint64(32)
+    for round_ in range(_ROUNDS):
+        if round_:
+            k0 = (k0 + _W0) & _MASK
+            k1 = (k1 + _W1) & _MASK
+        product0 = c0 * m0
+        product1 = c2 * m1
+        c0, c1, c2, c3 = ((product1 >> shift) ^ c1 ^ np.uint64(k0), product1 & mask,
+                          (product0 >> shift) ^ c3 ^ np.uint64(k1), product0 & mask)
+    return c0, c1, c2, c3
+
+
+class YieldStream:
+    def __init__(self, seed):
+        """
+        Random yields of the crops of a farm, keyed by (seed, day, tile).
+
+        :param seed: (integer) seed of the farm, up to 64 bits
+        """
+        self.seed = seed
+        self._key = (seed & _MASK, (seed >> 32) & _MASK)
+        """
+        self.seed: (integer) seed of the farm
+        self._key: (tuple) the seed as the two 32 bit words of the Philox key
+        """
+
+    def uniform32(self, day, tiles, stream=STREAM_YIELD):
+        """
+        :param day: (integer) day of the draw
+        :param tiles: (numpy.ndarray) tile numbers, row * columns + column
+        :param stream: (integer) what the numbers are used for
+        :return: (numpy.ndarray) a random 32 bit integer per tile, as uint64
+        """
+        tiles = np.asarray(tiles, dtype=np.uint64)
+        return philox((tiles, day, stream, 0), self._key)[0]
+
+    def yields(self, day, tiles, produce):
+        """
+        Draws the number of crops each plant gives, evenly from 1 up to its maximum. The draw is exact integer math,
+        there is no floating point rounding that could differ between machines.
+
+        :param day: (integer) day on which the crops became ready to harvest
+        :param tiles: (numpy.ndarray) tile numbers, row * columns + column
+        :param produce: (numpy.ndarray) maximum number of crops per plant of each tile
+        :return: (numpy.ndarray) number of crops per tile, as int64
+        """
+        produce = np.asarray(produce, dtype=np.uint64)
+        return (np.uint64(1) + ((self.uniform32(day, tiles) * produce) >> np.uint64(32))).astype(np.int64)
+
+
+_KNOWN_ANSWERS = (((0, 0, 0, 0), (0, 0), (0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8)),
+                  ((_MASK,) * 4, (_MASK, _MASK), (0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd)),
+                  ((0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344), (0xa4093822, 0x299f31d0),
+                   (0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1)))
+"""
+_KNOWN_ANSWERS: (tuple) of (counter, key, result) of Philox4x32-10 from the Random123 reference
+"""
+
+
+def _farm_state(game):
+    """
+    :return: (list) of the state of every tile that changes during the day
+    """
+    import farm_shard
+    return farm_shard.pack(game._mtr).tolist()
+
+
+def check(rows=200, columns=200, days=30, seed=7, shard_rows=50):
+    """
+    Checks the known answers and that the serial, sharded and fast forwarded end of day give the same farm.
+
+    :param rows: (integer) number of farm rows
+    :param columns: (integer) number of farm columns
+    :param days: (integer) number of days to play
+    :param seed: (integer) seed of the farms
+    :param shard_rows: (integer) number of farm rows per shard
+    """
+    import farm_shard
+    import main
+
+    for counter, key, answer in _KNOWN_ANSWERS:
+        result = tuple(int(word) for word in philox(counter, key))
+        assert result == answer, f"philox{counter, key} gave {result}, expected {answer}"
+    print('philox4x32-10 matches the known answers')
+
+    games = []
+    for _ in range(3):
+        game = main.Game(seed=seed)
+        game._ROWS, game._COLUMNS = rows, columns
+        game.init_farm()
+        farm_shard._fill(game)
+        game._revalue_all()
+        games.append(game)
+    serial, sharded, forwarded = games
+
+    start = time.perf_counter()
+    for _ in range(days):
+        serial.end_day()
+    took = [time.perf_counter() - start]
+
+    sharded.use_sharded_end_day(shard_rows)
+    start = time.perf_counter()
+    for _ in range(days):
+        sharded.end_day()
+    took.append(time.perf_counter() - start)
+    sharded.use_sharded_end_day(None)
+
+    start = time.perf_counter()
+    farm_shard.fast_forward(forwarded, days)
+    took.append(time.perf_counter() - start)
+
+    expected = _farm_state(serial)
+    for name, game in (('sharded', sharded), ('fast forward', forwarded)):
+        assert game._day == serial._day, f"{name} is at day {game._day}, serial at day {serial._day}"
+        assert _farm_state(game) == expected, f"{name} differs from serial"
+        assert game.farm_value() == serial.farm_value(), f"{name} farm value differs from serial"
+    yields = [tile._yield for rows in serial._mtr for tile in rows if isinstance(tile, main.Vegetable)]
+    print(f"{rows} x {columns} farm, {days} days, seed {seed}: serial {took[0]:.2f} s, sharded {took[1]:.2f} s, "
+          f"fast forward {took[2]:.2f} s, identical farms, mean yield {sum(yields) / max(1, len(yields)):.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the random yields are reproducible')
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--columns', type=int, default=200)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--shard-rows', type=int, default=50)
+    args = parser.parse_args()
+    check(args.rows, args.columns, args.days, args.seed, args.shard_rows)
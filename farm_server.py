@@ -0,0 +1,347 @@
+"""
+Asyncio server hosting many headless farms in one process, with a load generator to benchmark it.
+
+Clients connect over a local TCP socket and send fixed size frames, REQUEST: (op, seq, farm, x, y). Every request is
+answered with a RESPONSE frame: (status, seq, farm, money, day). The ops are the player actions of Game.execute, a farm
+is created with OP_OPEN. Each farm has a bounded queue of pending requests, a request for a farm whose queue is full is
+answered with STATUS_BUSY right away, so one busy farm does not hold up the other farms of the connection. The end of
+day of all farms that asked for it is done in one pass of the scheduler every tick. With a market all farms sell on one
+farm_market.Market, its prices are updated once per scheduler pass.
+
+Usage:
+    python farm_server.py serve [--port 8765] [--tick 0.05] [--market]
+    python farm_server.py load [--port 8765] [--farms 1000] [--clients 4] [--ops 50] [--rate 1]
+    python farm_server.py bench [--farms 1000] ...
+"""
+
+# import build in
+import argparse
+import asyncio
+import random
+import struct
+import subprocess
+import sys
+import time
+
+# import own
+import main
+
+
+REQUEST = struct.Struct('!BHIbb')
+RESPONSE = struct.Struct('!BHIqI')
+"""
+REQUEST: op (1 byte), seq (2 bytes), farm (4 bytes), column (1 byte), row (1 byte)
+RESPONSE: status (1 byte), seq (2 bytes), farm (4 bytes), money (8 bytes), day (4 bytes)
+"""
+
+OP_OPEN, OP_ACTION, OP_CLEAR_SELL, OP_BUY, OP_END_DAY, OP_SWITCH_BUY_LIST, OP_SCROLL_UP, OP_SCROLL_DOWN, \
+    OP_CLOSE, OP_STATS = range(10)
+COMMANDS = {OP_ACTION: 'action', OP_CLEAR_SELL: 'clear_sell', OP_BUY: 'buy', OP_END_DAY: 'end_day',
+            OP_SWITCH_BUY_LIST: 'switch_buy_list', OP_SCROLL_UP: 'scroll_up', OP_SCROLL_DOWN: 'scroll_down'}
+STATUS_OK, STATUS_UNKNOWN_FARM, STATUS_BAD_REQUEST, STATUS_BUSY = range(4)
+"""
+OP_STATS answers with the cpu time of the server in microseconds as money and the number of handled requests as day
+"""
+
+
+class Farm:
+    __slots__ = ('game', 'inbox', 'task')
+
+    def __init__(self, game, max_pending):
+        """
+        A farm hosted by the server.
+
+        :param game: (Game) the headless game of the farm
+        :param max_pending: (integer) number of requests that may wait for the farm
+        """
+        self.game = game
+        self.inbox = asyncio.Queue(max_pending)
+        self.task = None
+
+
+class FarmServer:
+    def __init__(self, max_pending=32, tick=0.05, market=None):
+        """
+        Hosts headless farms, see the module documentation for the protocol.
+
+        :param max_pending: (integer) number of requests that may wait per farm, more are answered with STATUS_BUSY
+        :param tick: (float) seconds between the passes of the scheduler that ends the days
+        :param market: (farm_market.Market) market shared by all farms, None for the fixed prices
+        """
+        self.max_pending = max_pending
+        self.tick = tick
+        self.market = market
+        self.farms = {}
+        self.handled = 0
+        self._day_requests = []
+        self._day_wanted = None
+        self._server = None
+        """
+        self.max_pending: (integer) number of requests that may wait per farm
+        self.tick: (float) seconds between the passes of the scheduler
+        self.market: (farm_market.Market) market shared by all farms, owned by the server
+        self.farms: (dict) farm id -> Farm
+        self.handled: (integer) number of handled requests
+        self._day_requests: (list) of (Farm, future) waiting for the next scheduler pass
+        self._day_wanted: (None) will become an asyncio.Event that is set when a day needs to end
+        self._server: (None) will become the asyncio server
+        """
+
+    async def start(self, host='127.0.0.1', port=8765):
+        """
+        Starts listening and the scheduler.
+
+        :param host: (str) address to listen on
+        :param port: (integer) port to listen on, 0 picks a free one
+        :return: (integer) the port listened on
+        """
+        self._day_wanted = asyncio.Event()
+        self._server = await asyncio.start_server(self._connection, host, port)
+        asyncio.get_running_loop().create_task(self._scheduler())
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    def _open(self, farm_id):
+        """
+        Creates the farm if it does not exist yet.
+
+        :param farm_id: (integer) id of the farm
+        :return: (Farm) the farm
+        """
+        farm = self.farms.get(farm_id)
+        if farm is None:
+            game = main.Game()
+            game.init_farm()
+            if self.market:
+                game.use_market(self.market, owner=False)
+                self.market.join()
+            farm = Farm(game, self.max_pending)
+            farm.task = asyncio.get_running_loop().create_task(self._farm_worker(farm, farm_id))
+            self.farms[farm_id] = farm
+        return farm
+
+    async def _connection(self, reader, writer):
+        """
+        Reads the requests of a client and hands them to the farms.
+        """
+        buffer = b''
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                end = len(buffer) - len(buffer) % REQUEST.size
+                for op, seq, farm_id, x, y in REQUEST.iter_unpack(buffer[:end]):
+                    if op == OP_OPEN:
+                        farm = self._open(farm_id)
+                    else:
+                        farm = self.farms.get(farm_id)
+                    if op == OP_STATS:
+                        self._reply(writer, STATUS_OK, seq, farm_id, int(time.process_time() * 1e6), self.handled)
+                    elif farm is None:
+                        self._reply(writer, STATUS_UNKNOWN_FARM, seq, farm_id, 0, 0)
+                    else:
+                        try:
+                            farm.inbox.put_nowait((op, seq, x, y, writer))
+                        except asyncio.QueueFull:
+                            # the client may retry later, waiting here would stall its requests for the other farms
+                            self._reply(writer, STATUS_BUSY, seq, farm_id, 0, 0)
+                buffer = buffer[end:]
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _reply(self, writer, status, seq, farm_id, money, day):
+        """
+        Sends a response frame, unless the client is gone.
+        """
+        if not writer.is_closing():
+            writer.write(RESPONSE.pack(status, seq, farm_id, money, day))
+
+    async def _farm_worker(self, farm, farm_id):
+        """
+        Handles the requests of one farm in order.
+        """
+        game = farm.game
+        while True:
+            op, seq, x, y, writer = await farm.inbox.get()
+            status = STATUS_OK
+            if op == OP_END_DAY:
+                done = asyncio.get_running_loop().create_future()
+                self._day_requests.append((farm, done))
+                self._day_wanted.set()
+                await done
+            elif op == OP_CLOSE:
+                self.farms.pop(farm_id, None)
+                if self.market:
+                    self.market.leave()
+                self._reply(writer, status, seq, farm_id, game._money, game._day)
+                # the requests queued behind the close are answered, no one would handle them anymore
+                while not farm.inbox.empty():
+                    op, seq, x, y, writer = farm.inbox.get_nowait()
+                    self._reply(writer, STATUS_UNKNOWN_FARM, seq, farm_id, 0, 0)
+                return
+            elif op in COMMANDS:
+                if 0 <= x < game._COLUMNS and 0 <= y < game._ROWS:
+                    game.execute(COMMANDS[op], (x, y))
+                else:
+                    game.execute(COMMANDS[op], 'outside')
+            elif op != OP_OPEN:
+                status = STATUS_BAD_REQUEST
+            self.handled += 1
+            self._reply(writer, status, seq, farm_id, game._money, game._day)
+
+    async def _scheduler(self):
+        """
+        Ends the day of all the farms that asked for it, in one pass per tick.
+        """
+        while True:
+            await self._day_wanted.wait()
+            await asyncio.sleep(self.tick)
+            self._day_wanted.clear()
+            requests, self._day_requests = self._day_requests, []
+            for farm, done in requests:
+                farm.game.end_day()
+            if self.market:
+                self.market.update()
+            for farm, done in requests:
+                done.set_result(None)
+
+
+async def _client(host, port, farm_ids, ops, window, latencies):
+    """
+    One client of the load generator: opens its farms and sends random actions with at most window requests in flight.
+
+    :return: (tuple) number of responses received and how many of them were STATUS_BUSY
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    rnd = random.Random(farm_ids[0] if farm_ids else 0)
+    requests = [(OP_OPEN, farm_id, 0, 0) for farm_id in farm_ids]
+    for _ in range(ops):
+        for farm_id in farm_ids:
+            op = rnd.choice((OP_ACTION, OP_ACTION, OP_ACTION, OP_CLEAR_SELL, OP_SCROLL_UP, OP_END_DAY))
+            requests.append((op, farm_id, rnd.randrange(4), rnd.randrange(3)))
+
+    sent = {}
+    credits = asyncio.Semaphore(window)
+
+    async def receive():
+        received = busy = 0
+        buffer = b''
+        while received < len(requests):
+            data = await reader.read(65536)
+            if not data:
+                break
+            buffer += data
+            end = len(buffer) - len(buffer) % RESPONSE.size
+            for status, seq, farm_id, money, day in RESPONSE.iter_unpack(buffer[:end]):
+                latencies.append(time.perf_counter() - sent.pop((seq, farm_id)))
+                credits.release()
+                received += 1
+                busy += status == STATUS_BUSY
+            buffer = buffer[end:]
+        return received, busy
+
+    receiver = asyncio.get_running_loop().create_task(receive())
+    for seq, (op, farm_id, x, y) in enumerate(requests):
+        await credits.acquire()
+        sent[(seq % 65536, farm_id)] = time.perf_counter()
+        writer.write(REQUEST.pack(op, seq % 65536, farm_id, x, y))
+        await writer.drain()
+    received, busy = await receiver
+    writer.close()
+    return received, busy
+
+
+async def _stats(host, port):
+    """
+    :return: (tuple) cpu seconds and handled requests of the server
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(REQUEST.pack(OP_STATS, 0, 0, 0, 0))
+    status, seq, farm_id, cpu, handled = RESPONSE.unpack(await reader.readexactly(RESPONSE.size))
+    writer.close()
+    return cpu / 1e6, handled
+
+
+async def load(host='127.0.0.1', port=8765, farms=1000, clients=4, ops=50, window=64, rate=1.0):
+    """
+    Load generator: spreads the farms over the clients, each farm gets ops random requests. Prints the throughput, the
+    latency and how many farms one core of the server could host when each farm sends rate requests per second.
+
+    :param host: (str) address of the server
+    :param port: (integer) port of the server
+    :param farms: (integer) number of farms
+    :param clients: (integer) number of client connections
+    :param ops: (integer) requests per farm
+    :param window: (integer) requests in flight per client
+    :param rate: (float) requests per second a farm is expected to make
+    """
+    cpu_start, handled_start = await _stats(host, port)
+    latencies = []
+    start = time.perf_counter()
+    ids = list(range(farms))
+    results = await asyncio.gather(*[_client(host, port, ids[i::clients], ops, window, latencies)
+                                     for i in range(clients)])
+    took = time.perf_counter() - start
+    cpu_end, handled_end = await _stats(host, port)
+
+    total = sum(received for received, _ in results)
+    busy = sum(busy for _, busy in results)
+    cpu = cpu_end - cpu_start
+    per_cpu = (handled_end - handled_start) / cpu if cpu else float('inf')
+    latencies.sort()
+    print(f"{farms} farms, {clients} clients, {total} requests in {took:.2f} s: {total / took:.0f} requests/s, "
+          f"{busy} answered busy")
+    print(f"  latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+    print(f"  server cpu {cpu:.2f} s: {per_cpu:.0f} requests per cpu second, "
+          f"{per_cpu / rate:.0f} farms per core at {rate:g} requests/s per farm")
+
+
+async def _serve(port, tick, max_pending, market):
+    if market:
+        import farm_market
+        market = farm_market.Market(farms=0)
+    server = FarmServer(max_pending, tick, market or None)
+    port = await server.start(port=port)
+    print(f"serving farms on 127.0.0.1:{port}", flush=True)
+    await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Multi-farm simulation server and load generator')
+    parser.add_argument('mode', choices=('serve', 'load', 'bench'))
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--tick', type=float, default=0.05)
+    parser.add_argument('--max-pending', type=int, default=32)
+    parser.add_argument('--farms', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=50)
+    parser.add_argument('--window', type=int, default=64)
+    parser.add_argument('--rate', type=float, default=1.0)
+    parser.add_argument('--market', action='store_true', help='all farms sell on one market')
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        asyncio.run(_serve(args.port, args.tick, args.max_pending, args.market))
+    else:
+        child = None
+        if args.mode == 'bench':
+            child = subprocess.Popen([sys.executable, __file__, 'serve', '--port', str(args.port),
+                                      '--tick', str(args.tick), '--max-pending', str(args.max_pending)] +
+                                     (['--market'] if args.market else []),
+                                     stdout=subprocess.PIPE, text=True)
+            child.stdout.readline()
+        try:
+            asyncio.run(load(port=args.port, farms=args.farms, clients=args.clients, ops=args.ops,
+                             window=args.window, rate=args.rate))
+        finally:
+            if child:
+                child.terminate()
+                child.wait()
@@ -0,0 +1,470 @@
+"""
+Sharded end of day for big farms.
+
+The state of every tile of the farm matrix ('_mtr') is packed into one float array in shared memory, one row per tile.
+The rows are split into shards of whole farm rows which a process pool advances in place with the same rules as
+Vegetable.end_day and Animal.end_day. The state stays in shared memory between the days (see ShardedGrid): the
+Vegetable and Animal objects of a farm row are only unpacked when the game uses the row, and only the used rows are
+packed again before the next day, so a day costs the shards plus the rows the player touched.
+
+With a seeded game (see farm_random) the yields of the crops that become ready to harvest are drawn per shard, keyed by
+the tile number, so the sharded result is the same as the serial one. fast_forward advances the packed farm many days in
+this process, without unpacking in between.
+
+Usage:
+    python farm_shard.py [--rows 500] [--columns 500] [--shard-rows 50] [--workers N] [--days 10]
+prints the time of the serial Game.end_day against the sharded one.
+"""
+
+# import build in
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+# import other
+import numpy as np
+
+# import own
+import farm_random
+import main
+
+
+FIELDS = ('type', 'dead', 'harvest',
+          'days_grown', 'watered', 'quality', 'times_grown', 'days_to_grow',
+          'age', 'adult', 'fed', 'petted', 'hunger', 'happy', 'days_since_product', 'age_adult', 'age_max',
+          'days_to_prod', 'quality_steps', 'yield', 'produce')
+COL = {name: i for i, name in enumerate(FIELDS)}
+EMPTY, VEGETABLE, ANIMAL = 0, 1, 2
+
+_VEG_ATTRS = (('dead', 'dead'), ('harvest', 'harvest'), ('days_grown', 'days_grown'), ('watered', 'watered'),
+              ('quality', '_quality'), ('times_grown', '_times_grown'), ('days_to_grow', '_days_to_grow'),
+              ('quality_steps', '_quality_steps'), ('yield', '_yield'), ('produce', '_produce'))
+_ANIM_ATTRS = (('dead', 'dead'), ('harvest', 'harvest'), ('age', 'age'), ('adult', 'adult'), ('fed', 'fed'),
+               ('petted', 'petted'), ('hunger', '_hunger'), ('happy', '_happy'),
+               ('days_since_product', '_days_since_product'), ('age_adult', '_AGE_ADULT'), ('age_max', '_AGE_MAX'),
+               ('days_to_prod', '_DAYS_TO_PROD'))
+_VEG_STATE = ((1, 'dead', bool), (2, 'harvest', bool), (3, 'days_grown', int), (4, 'watered', bool),
+              (5, '_quality', float), (6, '_times_grown', int), (18, '_quality_steps', int), (19, '_yield', int))
+_ANIM_STATE = ((1, 'dead', bool), (2, 'harvest', bool), (8, 'age', int), (9, 'adult', bool), (10, 'fed', bool),
+               (11, 'petted', bool), (12, '_hunger', int), (13, '_happy', int), (14, '_days_since_product', int))
+"""
+_VEG_ATTRS and _ANIM_ATTRS: (tuple) of (field, attribute) pairs that are packed from the objects into the array
+_VEG_STATE and _ANIM_STATE: (tuple) of (column, attribute, type) of the state that changes during the day, which is
+written back into the objects
+"""
+
+
+def pack(mtr, out=None):
+    """
+    Packs the state of the farm matrix into an array with a row per tile (row major) and a column per FIELDS entry.
+
+    :param mtr: (list) the farm matrix of a Game
+    :param out: (numpy.ndarray) array of the right shape to pack into, e.g. in shared memory, None creates one
+    :return: (numpy.ndarray) the packed state
+    """
+    empty = [0.0] * len(FIELDS)
+    values = []
+    for rows in mtr:
+        for tile in rows:
+            if isinstance(tile, main.Vegetable):
+                row = empty[:]
+                row[0] = VEGETABLE
+                for field, attr in _VEG_ATTRS:
+                    row[COL[field]] = getattr(tile, attr)
+            elif isinstance(tile, main.Animal):
+                row = empty[:]
+                row[0] = ANIMAL
+                for field, attr in _ANIM_ATTRS:
+                    row[COL[field]] = getattr(tile, attr)
+            else:
+                row = empty
+            values.append(row)
+
+    if out is None:
+        return np.array(values, dtype=np.float64).reshape(len(values), len(FIELDS))
+    out[:] = values
+    return out
+
+
+def unpack(state, mtr):
+    """
+    Writes the packed state back into the Vegetable and Animal objects of the farm matrix. The per kind constants,
+    e.g. days_to_grow, are not written back.
+
+    :param state: (numpy.ndarray) state as created by pack for the same matrix
+    :param mtr: (list) the farm matrix of a Game
+    """
+    values = iter(state.tolist())
+    for rows in mtr:
+        for tile in rows:
+            row = next(values)
+            if row[0] == VEGETABLE:
+                attrs = _VEG_STATE
+            elif row[0] == ANIMAL:
+                attrs = _ANIM_STATE
+            else:
+                continue
+            for index, attr, cast in attrs:
+                setattr(tile, attr, cast(row[index]))
+
+
+def end_day(state, stream=None, day=0, offset=0):
+    """
+    Advances the packed state one day in place, vectorized over the tiles with the rules of Vegetable.end_day and
+    Animal.end_day.
+
+    :param state: (numpy.ndarray) (part of the) state as created by pack
+    :param stream: (farm_random.YieldStream) draws the yields of the crops that become ready, None keeps them
+    :param day: (integer) the day that is being ended, as Game._day after it was increased
+    :param offset: (integer) tile number of the first row of state, the start of the shard
+    """
+    kind = state[:, 0]
+
+    veg = state[kind == VEGETABLE]
+    if len(veg):
+        days_grown = veg[:, 3]
+        days_to_grow = veg[:, 7]
+        die = days_grown >= days_to_grow
+        grow = ~die
+        veg[die, 1] = 1
+        days_grown[grow] += 1
+        ripe = grow & (days_grown == days_to_grow)
+        veg[ripe, 2] = 1
+        if stream is not None and ripe.any():
+            tiles = np.flatnonzero(kind == VEGETABLE)[ripe] + offset
+            veg[ripe, 19] = stream.yields(day, tiles, veg[ripe, 20])
+        watered = grow & (veg[:, 4] == 1)
+        veg[watered, 5] += 1 / days_to_grow[watered]
+        veg[watered, 18] += 1
+        veg[watered, 4] = 0
+        state[kind == VEGETABLE] = veg
+
+    anim = state[kind == ANIMAL]
+    if len(anim):
+        fed = anim[:, 10] == 1
+        hungry = anim[:, 12] < 0
+        petted = anim[:, 11] == 1
+
+        anim[fed, 10] = 0
+        anim[fed & hungry, 12] += 1
+        produce = fed & ~hungry & (anim[:, 9] == 1)
+        anim[produce, 14] += 1
+        product = produce & (anim[:, 14] == anim[:, 17])
+        anim[product, 2] = 1
+        anim[product, 14] = 0
+
+        anim[~fed, 12] -= 1
+        anim[~fed, 13] = -10
+        anim[~fed & (anim[:, 12] == -3), 1] = 1
+
+        anim[petted, 11] = 0
+        content = anim[:, 13] <= 85
+        anim[petted & content, 13] += 15
+        anim[petted & ~content, 13] = 100
+        anim[~petted, 13] -= 5
+
+        anim[:, 8] += 1
+        anim[(anim[:, 9] == 0) & (anim[:, 8] >= anim[:, 15]), 9] = 1
+        anim[anim[:, 8] >= anim[:, 16], 1] = 1
+        state[kind == ANIMAL] = anim
+
+
+def _end_day_shard(name, shape, start, stop, days, seed=None, first_day=0):
+    """
+    Runs in a worker process: advances the tiles start:stop of the state in the shared memory block.
+
+    :param name: (str) name of the shared memory block
+    :param shape: (tuple) shape of the state array
+    :param start: (integer) first tile of the shard
+    :param stop: (integer) tile after the last tile of the shard
+    :param days: (integer) number of days to advance
+    :param seed: (integer) seed of the random yields, None keeps the yields
+    :param first_day: (integer) the first day that is being ended
+    """
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        state = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        shard = state[start:stop]
+        stream = farm_random.YieldStream(seed) if seed is not None else None
+        for day in range(first_day, first_day + days):
+            end_day(shard, stream, day, start)
+        del state, shard
+    finally:
+        block.close()
+
+
+class ShardedGrid:
+    def __init__(self, grid):
+        """
+        Farm matrix of a game in the sharded mode. The state of all the tiles stays packed in a shared memory block
+        between the days, the Vegetable and Animal objects of a row are only brought up to date when the row is
+        used, and only the rows that were used are packed again before the next day. It acts as the farm matrix the
+        Game normally uses, self._mtr[y][x], including assignment and iterating over the rows.
+
+        :param grid: (list) the farm matrix of the game, or a grid acting as one
+        """
+        self._grid = grid
+        self._columns = len(grid[0]) if len(grid) else 0
+        self.shape = (len(grid) * self._columns, len(FIELDS))
+        self.block = shared_memory.SharedMemory(create=True, size=max(1, self.shape[0] * self.shape[1] * 8))
+        self.state = np.ndarray(self.shape, dtype=np.float64, buffer=self.block.buf)
+        pack(grid, out=self.state)
+        self._stale = set()
+        self._dirty = set()
+        """
+        self._grid: (list) the wrapped farm matrix with the Vegetable and Animal objects
+        self._columns: (integer) number of farm columns
+        self.shape: (tuple) shape of the state array, a row per tile
+        self.block: (multiprocessing.shared_memory.SharedMemory) the shared memory block holding the state
+        self.state: (numpy.ndarray) the packed state of all the tiles, in the shared memory block
+        self._stale: (set) farm rows whose objects are behind the state, they are unpacked when the row is used
+        self._dirty: (set) farm rows whose objects may have been changed, they are packed before the next day
+        """
+
+    def _rows(self, y):
+        """
+        :return: (numpy.ndarray) the part of the state holding the given farm row
+        """
+        return self.state[y * self._columns:(y + 1) * self._columns]
+
+    def _sync(self, y):
+        """
+        Brings the objects of a farm row up to date with the state.
+        """
+        if y in self._stale:
+            self._stale.discard(y)
+            unpack(self._rows(y), [self._grid[y]])
+
+    def __len__(self):
+        return len(self._grid)
+
+    def __getitem__(self, y):
+        if y < 0:
+            y += len(self._grid)
+        self._sync(y)
+        self._dirty.add(y)
+        return self._grid[y]
+
+    def __iter__(self):
+        for y in range(len(self._grid)):
+            yield self[y]
+
+    def peek(self, pos):
+        """
+        Reads a tile only to look at it, its row is brought up to date but does not have to be packed again.
+
+        :param pos: (tuple) (column, row) of the tile
+        :return: the crop, animal or None on the tile
+        """
+        self._sync(pos[1])
+        return self._grid[pos[1]][pos[0]]
+
+    def pack_changes(self):
+        """
+        Packs the farm rows that were used since the last day into the state.
+        """
+        for y in sorted(self._dirty):
+            pack([self._grid[y]], out=self._rows(y))
+        self._dirty.clear()
+
+    def advanced(self):
+        """
+        The state was advanced, all the objects are behind it now.
+        """
+        self._stale = set(range(len(self._grid)))
+
+    def release(self):
+        """
+        Brings all the objects up to date and frees the shared memory block.
+
+        :return: (list) the wrapped farm matrix
+        """
+        for y in sorted(self._stale):
+            self._sync(y)
+        del self.state
+        self.block.close()
+        self.block.unlink()
+        return self._grid
+
+
+class ShardedEndDay:
+    def __init__(self, shard_rows=64, workers=None):
+        """
+        Ends the day of a Game on a process pool, the farm rows are split into shards of shard_rows rows. The farm
+        matrix of the game becomes a ShardedGrid on the first run, so the state stays in shared memory between the days.
+
+        :param shard_rows: (integer) number of farm rows per shard
+        :param workers: (integer) number of worker processes, None uses the number of cpus
+        """
+        self.shard_rows = shard_rows
+        self.workers = workers or os.cpu_count()
+        self._pool = None
+        self.times = None
+        """
+        self.shard_rows: (integer) number of farm rows per shard
+        self.workers: (integer) number of worker processes
+        self._pool: (None) will become the ProcessPoolExecutor, started on first use
+        self.times: (None) will become a (pack, shards) tuple with the seconds spent in the last run
+        """
+
+    def start(self):
+        """
+        Starts the worker processes, otherwise done on the first run.
+        """
+        if self._pool is None:
+            # the workers share the resource tracker of this process, attaching to the block registers it there again,
+            # which does nothing, and the tracker still cleans it up when this process crashes
+            resource_tracker.ensure_running()
+            self._pool = ProcessPoolExecutor(self.workers)
+            for job in [self._pool.submit(os.getpid) for _ in range(self.workers)]:
+                job.result()
+
+    def run(self, game, days=1):
+        """
+        Ends the day of the game the given number of times. The objects of the farm are not updated, that happens
+        per row when the game uses them.
+
+        :param game: (Game) the game to advance
+        :param days: (integer) number of days to advance
+        """
+        self.start()
+
+        start_pack = time.perf_counter()
+        grid = game._mtr
+        if not isinstance(grid, ShardedGrid):
+            grid = game._mtr = ShardedGrid(grid)
+        else:
+            grid.pack_changes()
+        start_shards = time.perf_counter()
+        step = self.shard_rows * grid._columns
+        seed = game._yield_stream.seed if game._yield_stream else None
+        jobs = [self._pool.submit(_end_day_shard, grid.block.name, grid.shape, start, min(start + step, grid.shape[0]),
+                                  days, seed, game._day + 1)
+                for start in range(0, grid.shape[0], step)]
+        for job in jobs:
+            job.result()
+        grid.advanced()
+        self.times = (start_shards - start_pack, time.perf_counter() - start_shards)
+        game._day += days
+
+    @staticmethod
+    def release(game):
+        """
+        Gives the game its plain farm matrix back, with all the objects up to date.
+
+        :param game: (Game) the game
+        """
+        if isinstance(game._mtr, ShardedGrid):
+            game._mtr = game._mtr.release()
+
+    def close(self):
+        """
+        Shuts the process pool down.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def fast_forward(game, days):
+    """
+    Advances a game many days at once: the farm is packed once, advanced vectorized in this process and unpacked once.
+    The result is the same as calling Game.end_day days times, except that the metrics are only recorded at the end.
+
+    :param game: (Game) the game to advance
+    :param days: (integer) number of days to advance
+    """
+    state = pack(game._mtr)
+    for day in range(game._day + 1, game._day + days + 1):
+        end_day(state, game._yield_stream, day)
+    unpack(state, game._mtr)
+    game._day += days
+    game._revalue_all()
+    if game._metrics:
+        game._metrics.record(game)
+
+
+def _fill(game, seed=0):
+    """
+    Fills every tile of the game with a crop or animal in a mixed state, for the benchmark.
+
+    :param game: (Game) game on which init_farm has been called
+    :param seed: (integer) seed of the mix
+    """
+    import random
+    rnd = random.Random(seed)
+    vegetables = [row[0] for row in game._buy_list]
+    animals = [row[0] for row in main.farm_catalog.CATALOG.buy_list('animals')]
+    for rows in game._mtr:
+        for j in range(len(rows)):
+            if rnd.random() < 0.6:
+                tile = main.Vegetable(rnd.choice(vegetables))
+                tile.days_grown = rnd.randrange(tile._days_to_grow)
+                tile.watered = rnd.random() < 0.5
+            else:
+                tile = main.Animal(rnd.choice(animals))
+                tile.age = rnd.randrange(tile._AGE_MAX)
+                tile.adult = tile.age >= tile._AGE_ADULT
+                tile.fed = rnd.random() < 0.8
+                tile.petted = rnd.random() < 0.5
+            rows[j] = tile
+
+
+def benchmark(rows=500, columns=500, shard_rows=50, workers=None, days=10):
+    """
+    Prints the time of the serial end of day against the sharded one on a filled farm and checks they agree.
+
+    :param rows: (integer) number of farm rows
+    :param columns: (integer) number of farm columns
+    :param shard_rows: (integer) number of farm rows per shard
+    :param workers: (integer) number of worker processes, None uses the number of cpus
+    :param days: (integer) number of days to advance
+    """
+    games = []
+    for _ in range(2):
+        game = main.Game()
+        game._ROWS, game._COLUMNS = rows, columns
+        game.init_farm()
+        _fill(game)
+        games.append(game)
+    serial, sharded = games
+
+    start = time.perf_counter()
+    for _ in range(days):
+        serial.end_day()
+    serial_time = time.perf_counter() - start
+
+    sharded.use_sharded_end_day(shard_rows, workers)
+    sharder = sharded._sharded
+    sharder.start()
+    start = time.perf_counter()
+    sharded.end_day()
+    first_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(days - 1):
+        sharded.end_day()
+    sharded_time = time.perf_counter() - start
+    start = time.perf_counter()
+    sharder.release(sharded)
+    release_time = time.perf_counter() - start
+    sharded.use_sharded_end_day(None)
+
+    same = (pack(serial._mtr) == pack(sharded._mtr)).all()
+    print(f"{rows} x {columns} tiles, {days} day(s), {sharder.workers} workers, {shard_rows} rows per shard")
+    print(f"  serial:  {serial_time:8.3f} s, {serial_time / days:.3f} s per day")
+    print(f"  sharded: {first_time + sharded_time + release_time:8.3f} s (speedup "
+          f"{serial_time / (first_time + sharded_time + release_time):.2f}x, results equal: {same})")
+    print(f"    first day {first_time:.3f} s (packs the farm), then {sharded_time / max(1, days - 1):.3f} s per day, "
+          f"release {release_time:.3f} s (unpacks the farm)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the serial and sharded end of day')
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--columns', type=int, default=500)
+    parser.add_argument('--shard-rows', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--days', type=int, default=10)
+    args = parser.parse_args()
+    benchmark(args.rows, args.columns, args.shard_rows, args.workers, args.days)
@@ -0,0 +1,149 @@
+"""
+Sprite atlas and cached tile surfaces for drawing the farm field.
+
+The atlas is one image with a sprite per kind of tile and stage, laid out as in LAYOUT. It is loaded once and converted
+to the format of the display, when there is no atlas image simple sprites are drawn instead. For each label a tile can
+show, e.g. ('Corn', 'Vegetable', 'Growing, watered'), the sprite and the label text are put together once into a tile
+surface, after that drawing the field is a single Surface.blits call per frame.
+
+Usage:
+    python farm_sprites.py [--frames 600]
+compares the frame time of the text only renderer with the sprite renderer, without opening a window.
+"""
+
+# import build in
+import argparse
+import os
+import time
+
+# import own
+import main
+
+
+ATLAS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tiles.png')
+TILE_SIZE = (150, 120)
+LAYOUT = (('Vegetable', ('Planted', 'Growing', 'Harvest', 'Dead')),
+          ('Animal', ('Youngster', 'Adult', 'Produce', 'Dead')),
+          ('clear', ('Soil',)))
+"""
+ATLAS_FILE: (str) path to the atlas image
+TILE_SIZE: (tuple) width and height of a tile and of a sprite in the atlas
+LAYOUT: (tuple) a row of the atlas per kind with a sprite per stage
+"""
+
+_COLORS = {'Vegetable': (0, 205, 0), 'Animal': (204, 0, 0), 'clear': (255, 128, 0), 'Dead': (145, 58, 4)}
+"""
+_COLORS: (dict) label color per kind or for dead crops and animals, the same as Game.set_labels
+"""
+
+
+def _stage(kind, sub_text):
+    """
+    :param kind: (str) 'Vegetable', 'Animal' or 'clear'
+    :param sub_text: (str) sub label text of the tile, e.g. 'Growing, watered'
+    :return: (str) the stage of the sprite for the tile
+    """
+    if not sub_text:
+        return 'Soil'
+    stage = sub_text.split(',')[0].split(' ')[0]
+    return stage or 'Planted'
+
+
+class TileAtlas:
+    def __init__(self, font, font_size, path=ATLAS_FILE):
+        """
+        Loads the atlas and keeps the composed tile surfaces. The display must be set before.
+
+        :param font: (pygame.font.Font) font of the labels
+        :param font_size: (integer) size of the font, used to place the sub label
+        :param path: (str) path to the atlas image, simple sprites are drawn when it does not exist
+        """
+        pygame = main._import_pygame()
+        self._font = font
+        self._font_size = font_size
+        self._sprites = {}
+        self._tiles = {}
+        """
+        self._font: (pygame.font.Font) font of the labels
+        self._font_size: (integer) size of the font
+        self._sprites: (dict) (kind, stage) -> sprite surface in the display format
+        self._tiles: (dict) (name, kind, sub_text) -> composed tile surface
+        """
+
+        width, height = TILE_SIZE
+        if os.path.isfile(path):
+            atlas = pygame.image.load(path).convert()
+            for row, (kind, stages) in enumerate(LAYOUT):
+                for column, stage in enumerate(stages):
+                    rect = pygame.Rect(column * width, row * height, width, height)
+                    self._sprites[(kind, stage)] = atlas.subsurface(rect).copy()
+        else:
+            for kind, stages in LAYOUT:
+                for stage in stages:
+                    sprite = pygame.Surface(TILE_SIZE).convert()
+                    rgb = _COLORS['Dead' if stage == 'Dead' else kind]
+                    sprite.fill(tuple(c // 5 for c in rgb))
+                    pygame.draw.rect(sprite, tuple(c // 2 for c in rgb), sprite.get_rect(), 2)
+                    self._sprites[(kind, stage)] = sprite
+
+    def tile(self, name, kind, sub_text):
+        """
+        Gets the tile surface for a label, composing it the first time.
+
+        :param name: (str) main label text
+        :param kind: (str) 'Vegetable', 'Animal' or 'clear'
+        :param sub_text: (str) sub label text or None
+        :return: (pygame.Surface) the tile
+        """
+        key = (name, kind, sub_text)
+        tile = self._tiles.get(key)
+        if tile is None:
+            stage = _stage(kind, sub_text)
+            tile = self._sprites.get((kind, stage), self._sprites[('clear', 'Soil')]).copy()
+            rgb = _COLORS['Dead' if stage == 'Dead' else kind]
+            tile.blit(self._font.render(name, True, rgb), (50, 25))
+            if sub_text:
+                tile.blit(self._font.render(sub_text, True, rgb), (50, 25 + 5 + self._font_size))
+            self._tiles[key] = tile
+        return tile
+
+
+def benchmark(frames=600):
+    """
+    Prints the frame time of the text only renderer against the sprite renderer on a filled farm, without a window.
+
+    :param frames: (integer) number of frames to draw with each renderer
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    results = []
+    for sprites in (False, True):
+        game = main.Game(sprites=sprites)
+        game.on_init()
+        game._money = 10 ** 6
+        for y in range(game._ROWS):
+            for x in range(game._COLUMNS):
+                game.execute('buy', (x, y))
+                if (x + y) % 2:
+                    game.execute('switch_buy_list')
+        game.execute('end_day')
+        game.det_mouse_pos((60, 60))
+
+        game.on_render()
+        start = time.perf_counter()
+        for _ in range(frames):
+            game.on_loop()
+            game.on_render()
+        results.append((time.perf_counter() - start) / frames)
+        game.on_cleanup()
+
+    text, sprite = results
+    print(f"{frames} frames of a {game._COLUMNS} x {game._ROWS} farm")
+    print(f"  text renderer:   {text * 1000:.3f} ms per frame")
+    print(f"  sprite renderer: {sprite * 1000:.3f} ms per frame ({text / sprite:.2f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the text and sprite renderers')
+    parser.add_argument('--frames', type=int, default=600)
+    args = parser.parse_args()
+    benchmark(args.frames)
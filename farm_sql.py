@@ -1,7 +1,253 @@
+import json
+import math
+import re
 import sqlite3
+import sys
+import threading
+import time
 from sqlite3 import Error
 
 
+_diagnostics = None
+"""
+_diagnostics: (None) will become the QueryDiagnostics recording the queries, see enable_diagnostics
+"""
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(query):
+    """
+    :param query: (str) SQL command string
+    :return: (str) the query on one line with the literal strings and numbers replaced by '?'
+    """
+    return _SPACES.sub(' ', _LITERALS.sub('?', query)).strip()
+
+
+def _shape(args):
+    """
+    :param args: (tuple) of arguments of a query
+    :return: (str) the types of the arguments, e.g. '(str, int)'
+    """
+    if args is None:
+        return '()'
+    return '(' + ', '.join(type(arg).__name__ for arg in args) + ')'
+
+
+class QueryDiagnostics:
+    _EXPLAINED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+    """
+    _EXPLAINED: (tuple) statements that get a query plan, the others never scan a table
+    """
+
+    def __init__(self, slow_threshold=0.005, explain=True, max_slow=1000):
+        """
+        Records the latency of every query run by the execute functions of this module.
+
+        :param slow_threshold: (float) seconds from which a query goes into the slow query log
+        :param explain: (bool) capture the 'EXPLAIN QUERY PLAN' of each statement the first time it runs
+        :param max_slow: (integer) number of slow queries kept, the oldest are dropped
+        """
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.max_slow = max_slow
+        self.statements = {}
+        self.slow = []
+        self.scans = {}
+        self._lock = threading.Lock()
+        """
+        self.slow_threshold: (float) seconds from which a query goes into the slow query log
+        self.explain: (bool) capture the query plans
+        self.max_slow: (integer) number of slow queries kept
+        self.statements: (dict) normalized query -> dict with the count, errors, total and max seconds, last error and
+        histogram of the statement, the histogram counts the runs per power of two microseconds
+        self.slow: (list) of dicts with the time, seconds, normalized query, argument shape and error of slow queries
+        self.scans: (dict) normalized query -> list of the query plan lines of statements doing a full table scan
+        self._lock: (threading.Lock) the catalog and the simulation thread run queries from other threads
+        """
+
+    def _plan(self, connection, query, args):
+        """
+        :return: (list) of the query plan lines when the query scans a table, None when it does not
+        """
+        try:
+            plan = connection.execute('EXPLAIN QUERY PLAN ' + query, args or ()).fetchall()
+        except Error:
+            return None
+        details = [row[-1] for row in plan]
+        if any(detail.startswith('SCAN') for detail in details):
+            return details
+        return None
+
+    def record(self, connection, query, args, seconds, error=None):
+        """
+        Records one run of a query.
+
+        :param connection: (sqlite3.connect(path)) connection the query ran on, used for the query plan
+        :param query: (str) SQL command string
+        :param args: (tuple) of arguments of the query, a list of them for execute_many
+        :param seconds: (float) time the query took
+        :param error: (str) error message when the query failed
+        """
+        key = normalize(query)
+        many = isinstance(args, list)
+        shape = f"{len(args)} x {_shape(args[0] if args else None)}" if many else _shape(args)
+        with self._lock:
+            statement = self.statements.get(key)
+            first = statement is None
+            if first:
+                statement = self.statements[key] = {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+                                                    'error': None, 'histogram': {}}
+            statement['count'] += 1
+            statement['total'] += seconds
+            statement['max'] = max(statement['max'], seconds)
+            bucket = str(max(0, int(math.log2(seconds * 1e6))) if seconds > 0 else 0)
+            statement['histogram'][bucket] = statement['histogram'].get(bucket, 0) + 1
+            if error:
+                statement['errors'] += 1
+                statement['error'] = error
+            if seconds >= self.slow_threshold or error:
+                self.slow.append({'time': time.time(), 'seconds': seconds, 'query': key, 'args': shape,
+                                  'error': error})
+                del self.slow[:-self.max_slow]
+
+        if first and self.explain and key.upper().startswith(self._EXPLAINED):
+            plan = self._plan(connection, query, args[0] if many and args else args)
+            if plan:
+                with self._lock:
+                    self.scans[key] = plan
+
+    def save(self, path):
+        """
+        :param path: (str) path of the json file to store the recorded session in
+        """
+        with self._lock:
+            data = {'slow_threshold': self.slow_threshold, 'statements': self.statements, 'slow': self.slow,
+                    'scans': self.scans}
+            with open(path, 'w') as file:
+                json.dump(data, file, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: (str) path of a json file made by save
+        :return: (QueryDiagnostics) with the recorded session
+        """
+        with open(path) as file:
+            data = json.load(file)
+        diagnostics = cls(data['slow_threshold'], explain=False)
+        diagnostics.statements = data['statements']
+        diagnostics.slow = data['slow']
+        diagnostics.scans = data['scans']
+        return diagnostics
+
+    @staticmethod
+    def _percentile(histogram, count, fraction):
+        """
+        :return: (float) upper bound in seconds of the histogram bucket that holds the given fraction of the runs
+        """
+        seen = 0
+        for bucket in sorted(histogram, key=int):
+            seen += histogram[bucket]
+            if seen >= count * fraction:
+                return 2 ** (int(bucket) + 1) / 1e6
+        return 0.0
+
+    def report(self, file=None, slow=20):
+        """
+        Prints the statements by total time with their histograms and table scans, followed by the slowest queries.
+
+        :param file: (file) to print to, sys.stdout when None
+        :param slow: (integer) number of slow queries to print
+        """
+        file = file or sys.stdout
+        statements = sorted(self.statements.items(), key=lambda item: item[1]['total'], reverse=True)
+        print(f"{len(statements)} statements, {sum(s['count'] for _, s in statements)} queries, "
+              f"{sum(s['total'] for _, s in statements) * 1000:.1f} ms", file=file)
+        for query, statement in statements:
+            count = statement['count']
+            histogram = statement['histogram']
+            print(f"\n{query}", file=file)
+            print(f"  {count} runs, {statement['errors']} errors, total {statement['total'] * 1000:.2f} ms, "
+                  f"mean {statement['total'] / count * 1e6:.0f} us, "
+                  f"p50 < {self._percentile(histogram, count, 0.5) * 1e6:.0f} us, "
+                  f"p99 < {self._percentile(histogram, count, 0.99) * 1e6:.0f} us, "
+                  f"max {statement['max'] * 1e6:.0f} us", file=file)
+            if statement['error']:
+                print(f"  last error: {statement['error']}", file=file)
+            largest = max(histogram.values())
+            for bucket in sorted(histogram, key=int):
+                low = 2 ** int(bucket) if int(bucket) else 0
+                bar = '#' * max(1, round(histogram[bucket] / largest * 40))
+                print(f"  {low:>9} us {histogram[bucket]:>8} {bar}", file=file)
+            if query in self.scans:
+                print('  full table scan: ' + '; '.join(self.scans[query]), file=file)
+
+        if self.slow:
+            print(f"\n{len(self.slow)} queries slower than {self.slow_threshold * 1000:g} ms or failed, slowest:",
+                  file=file)
+            for entry in sorted(self.slow, key=lambda e: e['seconds'], reverse=True)[:slow]:
+                error = f" error: {entry['error']}" if entry['error'] else ''
+                print(f"  {entry['seconds'] * 1000:8.2f} ms {entry['query']} {entry['args']}{error}", file=file)
+
+
+def enable_diagnostics(slow_threshold=0.005, explain=True):
+    """
+    Starts recording all queries run by the execute functions of this module, at a few microseconds per query.
+    Failing queries are recorded as well, also when feedback is off.
+
+    :param slow_threshold: (float) seconds from which a query goes into the slow query log
+    :param explain: (bool) capture the 'EXPLAIN QUERY PLAN' of each statement the first time it runs
+    :return: (QueryDiagnostics) the recorder
+    """
+    global _diagnostics
+    _diagnostics = QueryDiagnostics(slow_threshold, explain)
+    return _diagnostics
+
+
+def disable_diagnostics():
+    """
+    Stops recording the queries.
+
+    :return: (QueryDiagnostics) the recorder of the session, None if it was not enabled
+    """
+    global _diagnostics
+    diagnostics, _diagnostics = _diagnostics, None
+    return diagnostics
+
+
+def _execute(connection, cursor, query, args=None, many=False, fetch=False):
+    """
+    Runs a query on the cursor, timed when the diagnostics are enabled.
+
+    :param connection: (sqlite3.connect(path)) connection of the cursor
+    :param cursor: (sqlite3.Cursor) cursor to run the query on
+    :param query: (str) SQL command string
+    :param args: (tuple) of arguments, a list of them when many is set, None for none
+    :param many: (bool) run the query for every tuple of arguments
+    :param fetch: (bool) fetch and return all the rows
+    :return: (list) of rows when fetch is set
+    """
+    diagnostics = _diagnostics
+    start = time.perf_counter() if diagnostics else 0
+    try:
+        if many:
+            cursor.executemany(query, args)
+        elif args is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query, args)
+        result = cursor.fetchall() if fetch else None
+    except Error as e:
+        if diagnostics:
+            diagnostics.record(connection, query, args, time.perf_counter() - start, str(e))
+        raise
+    if diagnostics:
+        diagnostics.record(connection, query, args, time.perf_counter() - start)
+    return result
+
+
 def create_connection(path='farmsim.sql', feedback=False):
     """
     Create connection to an sqlite database
@@ -34,7 +280,7 @@ def execute_query(connection, query, feedback=False):
     """
     cursor = connection.cursor()
     try:
-        cursor.execute(query)
+        _execute(connection, cursor, query)
         connection.commit()
         if feedback:
             print("Query executed")
@@ -57,11 +303,35 @@ def execute_query_v2(connection, query, args, feedback=False):
     """
     cursor = connection.cursor()
     try:
-        cursor.execute(query, args)
+        _execute(connection, cursor, query, args)
+        connection.commit()
+        if feedback:
+            print("Query executed")
+    except Error as e:
+        if feedback:
+            print(f"Error: '{e}'")
+        else:
+            pass
+
+
+def execute_many(connection, query, args_list, feedback=False):
+    """
+    Executes the given query once for every argument tuple in the list, all in a single transaction.
+
+    :param connection: (sqlite3.connect(path)) connection to a database to execute query on
+    :param query: (str) SQL command string of the query that needs to be executed
+    :param args_list: (list) of tuples of arguments that need to be inserted into the query
+    :param feedback: (bool) give sql (error) feedback
+    :return:
+    """
+    cursor = connection.cursor()
+    try:
+        _execute(connection, cursor, query, args_list, many=True)
         connection.commit()
         if feedback:
             print("Query executed")
     except Error as e:
+        connection.rollback()
         if feedback:
             print(f"Error: '{e}'")
         else:
@@ -81,8 +351,7 @@ def execute_read_query(connection, query, feedback=False):
     cursor = connection.cursor()
     result = None
     try:
-        cursor.execute(query)
-        result = cursor.fetchall()
+        result = _execute(connection, cursor, query, fetch=True)
     except Error as e:
         if feedback:
             print(f"Error: '{e}'")
@@ -106,8 +375,7 @@ def execute_read_query_v2(connection, query, args, feedback=False):
     cursor = connection.cursor()
     result = None
     try:
-        cursor.execute(query, args)
-        result = cursor.fetchall()
+        result = _execute(connection, cursor, query, args, fetch=True)
     except Error as e:
         if feedback:
             print(f"Error: '{e}'")
@@ -232,5 +500,10 @@ def _insert_anim():
         print(i)
 
 if __name__ == '__main__':
-    _insert_vegs()
-    _insert_anim()
+    # python farm_sql.py                  creates and fills the catalog tables
+    # python farm_sql.py report [path]    prints the report of a session recorded with main.py --sql-log
+    if sys.argv[1:2] == ['report']:
+        QueryDiagnostics.load(sys.argv[2] if len(sys.argv) > 2 else 'sqlsession.json').report()
+    else:
+        _insert_vegs()
+        _insert_anim()
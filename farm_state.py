@@ -0,0 +1,177 @@
+"""
+Copy-on-write farm matrix for forking a game, e.g. to compare 'harvest now' with 'wait a day'.
+
+A CowGrid can be forked in constant time: the fork and the original share all rows and the Vegetable and Animal objects
+in them. A row is only copied by the first of them to change it and a crop or animal only when it is accessed through
+indexing, so a fork costs memory in proportion to the tiles it touches. Indexing works as for the list of lists the
+Game normally uses, self._mtr[y][x], including assignment and iterating over the rows.
+"""
+
+# import build in
+import copy
+
+
+class _Row:
+    __slots__ = ('token', 'cells', 'owners')
+
+    def __init__(self, token, cells, owners):
+        """
+        A row of the grid with the grid that may change it and per tile the grid that may change the object on it.
+
+        :param token: (object) token of the grid owning the row
+        :param cells: (list) the crops, animals or None of the row
+        :param owners: (list) per cell the token of the grid owning the object
+        """
+        self.token = token
+        self.cells = cells
+        self.owners = owners
+
+
+class _RowView:
+    __slots__ = ('_grid', '_y')
+
+    def __init__(self, grid, y):
+        """
+        What self._mtr[y] returns, indexing it reads or writes the tile of the grid.
+
+        :param grid: (CowGrid) the grid
+        :param y: (integer) index of the row
+        """
+        self._grid = grid
+        self._y = y
+
+    def __getitem__(self, x):
+        return self._grid.get(x, self._y)
+
+    def __setitem__(self, x, value):
+        self._grid.set(x, self._y, value)
+
+    def __len__(self):
+        return self._grid.columns
+
+    def __iter__(self):
+        for x in range(self._grid.columns):
+            yield self._grid.get(x, self._y)
+
+
+class CowGrid:
+    def __init__(self, rows, columns):
+        """
+        Empty farm matrix with copy-on-write rows and tiles.
+
+        :param rows: (integer) number of rows
+        :param columns: (integer) number of columns
+        """
+        self.rows = rows
+        self.columns = columns
+        self._token = object()
+        self._rows = [_Row(self._token, [None] * columns, [self._token] * columns) for _ in range(rows)]
+        self._rows_token = self._token
+        """
+        self.rows: (integer) number of rows
+        self.columns: (integer) number of columns
+        self._token: (object) identifies this grid as the owner of rows and objects, replaced on a fork
+        self._rows: (list) of _Row, shared with forks until changed
+        self._rows_token: (object) token of the grid owning the list of rows
+        """
+
+    @classmethod
+    def adopt(cls, mtr):
+        """
+        Makes a grid of the list of lists a Game uses as farm matrix, the lists are taken over without copying.
+
+        :param mtr: (list) of rows with the crops, animals or None
+        :return: (CowGrid) the grid
+        """
+        grid = cls(0, len(mtr[0]) if mtr else 0)
+        grid.rows = len(mtr)
+        grid._rows = [_Row(grid._token, row, [grid._token] * len(row)) for row in mtr]
+        return grid
+
+    def fork(self):
+        """
+        Forks the grid in constant time, both grids share everything until they change it.
+
+        :return: (CowGrid) the fork
+        """
+        other = CowGrid.__new__(CowGrid)
+        other.rows = self.rows
+        other.columns = self.columns
+        other._token = object()
+        other._rows = self._rows
+        other._rows_token = None
+        # this grid no longer owns anything it shares with the fork
+        self._token = object()
+        return other
+
+    def discard(self):
+        """
+        Drops the grid's references to the rows, after which it can no longer be used.
+        """
+        self._rows = None
+        self._token = None
+
+    def _own_row(self, y):
+        """
+        Makes sure this grid owns the list of rows and the row, copying them if they are shared.
+
+        :param y: (integer) index of the row
+        :return: (_Row) the row owned by this grid
+        """
+        if self._rows_token is not self._token:
+            self._rows = list(self._rows)
+            self._rows_token = self._token
+        row = self._rows[y]
+        if row.token is not self._token:
+            row = _Row(self._token, list(row.cells), list(row.owners))
+            self._rows[y] = row
+        return row
+
+    def peek(self, pos):
+        """
+        Reads a tile without taking ownership of its object, which must then not be changed.
+
+        :param pos: (tuple) (column, row) of the tile
+        :return: the crop, animal or None on the tile
+        """
+        return self._rows[pos[1]].cells[pos[0]]
+
+    def get(self, x, y):
+        """
+        Reads a tile for changing it, its object is copied first if it is shared with another grid.
+
+        :param x: (integer) column of the tile
+        :param y: (integer) row of the tile
+        :return: the crop, animal or None on the tile
+        """
+        row = self._rows[y]
+        tile = row.cells[x]
+        if tile is None or row.owners[x] is self._token:
+            return tile
+        row = self._own_row(y)
+        tile = copy.copy(tile)
+        row.cells[x] = tile
+        row.owners[x] = self._token
+        return tile
+
+    def set(self, x, y, value):
+        """
+        :param x: (integer) column of the tile
+        :param y: (integer) row of the tile
+        :param value: the crop, animal or None to put on the tile
+        """
+        row = self._own_row(y)
+        row.cells[x] = value
+        row.owners[x] = self._token
+
+    def __getitem__(self, y):
+        if not -self.rows <= y < self.rows:
+            raise IndexError('row index out of range')
+        return _RowView(self, y % self.rows)
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        for y in range(self.rows):
+            yield _RowView(self, y)
@@ -0,0 +1,221 @@
+"""
+Valuation tables of the crops and animals of the farmsim game.
+
+The sale values of Vegetable.harvest_crop, Animal.get_produce and Animal.sell only depend on a few small integers
+(quality steps, age and happiness) and the stats of the kind. The tables below hold these values for every possible
+input and are built once per kind from the species catalog, so valuing an entity is a list lookup.
+"""
+
+# import build in
+from math import floor
+
+# import own
+import farm_catalog
+
+
+def vegetable_harvest_value(produce, basic_val, quality):
+    """
+    Value of a harvest as calculated by Vegetable.harvest_crop
+
+    :param produce: (integer) number of crops harvested
+    :param basic_val: (integer) basic value of the crop
+    :param quality: (float) quality of the crop
+    :return: (integer) value of the harvest
+    """
+    return floor(produce * basic_val * quality)
+
+
+def animal_produce_value(base_val_prod, happy):
+    """
+    Value of the product of an animal, a happy animal makes more valuable products.
+
+    :param base_val_prod: (integer) base value of the product
+    :param happy: (integer) happiness of the animal
+    :return: (integer) value of the product
+    """
+    if happy < 25:
+        prod_val = base_val_prod
+    else:
+        prod_val = floor(happy / 25 * base_val_prod)
+    return prod_val
+
+
+def animal_sell_value(base_val_anim, age_max, adult, age, happy):
+    """
+    Value of a sold animal. First the animal must be an adult to get more value. Then the age up to 1/2 its maximum age
+    will increase its value if the animal is older it will go down again. A happy animal is worth more.
+    Finally the value of the animal will be rounded down.
+
+    :param base_val_anim: (integer) base value of the animal
+    :param age_max: (integer) maximum age of the animal
+    :param adult: (boolean) is the animal an adult
+    :param age: (integer) age of the animal
+    :param happy: (integer) happiness of the animal
+    :return: (integer) value of the sold animal
+    """
+    val = base_val_anim
+    if adult:
+        if age * 2 / (age_max / 2) > 1 and age <= (age_max / 2):
+            val = val * age * 2 / (age_max / 2)
+
+        elif (age_max - age) * 2 / (age_max / 2) > 1 and age >= (age_max / 2):
+            val = val * (age_max - age) * 2 / (age_max / 2)
+
+        if happy > 50:
+            val = val * happy / 50
+
+        val = floor(val)
+
+    return val
+
+
+class VegetableValues:
+    def __init__(self, row):
+        """
+        Harvest values of one kind of crop by the number of crops harvested and the number of times it has been watered
+        while growing (quality steps). Each step adds 1 / days_to_grow to the quality, the table adds them up in the
+        same order as Vegetable.end_day so the rounded values are exactly the same.
+
+        :param row: (tuple) row of the vegetables table
+        """
+        self._days_to_grow = row[2]
+        self._basic_val = row[3]
+        self._produce = row[4]
+        self._harvest = []
+        """
+        self._days_to_grow: (integer) days until the crop can be harvested
+        self._basic_val: (integer) basic value of the crop
+        self._produce: (integer) the maximum crops harvested from the plant per harvest
+        self._harvest: (list) by number of crops (0 up to produce) of lists of the harvest value by quality steps, up to
+        watering every day of every grow cycle
+        """
+
+        qualities = []
+        quality = 1.0
+        for step in range(self._days_to_grow * max(row[5], 1) + 1):
+            qualities.append(quality)
+            quality += 1 / self._days_to_grow
+        for count in range(self._produce + 1):
+            self._harvest.append([vegetable_harvest_value(count, self._basic_val, quality) for quality in qualities])
+
+    def harvest(self, steps, quality, count=None):
+        """
+        :param steps: (integer) quality steps of the crop, -1 when they do not match the table, e.g. after a refresh
+        :param quality: (float) quality of the crop, used when the steps are outside of the table
+        :param count: (integer) number of crops harvested, None for the maximum of the kind
+        :return: (integer) value of the harvest
+        """
+        if count is None:
+            count = self._produce
+        if 0 <= steps < len(self._harvest[0]) and 0 <= count <= self._produce:
+            return self._harvest[count][steps]
+        return vegetable_harvest_value(count, self._basic_val, quality)
+
+
+class AnimalValues:
+    _HAPPY_SELL = 50
+    _HAPPY_PROD = 24
+    _HAPPY_MAX = 100
+    """
+    _HAPPY_SELL: (integer) happiness up to which the sell value does not change
+    _HAPPY_PROD: (integer) happiness up to which the product value does not change
+    _HAPPY_MAX: (integer) maximum happiness of an animal
+    """
+
+    def __init__(self, row):
+        """
+        Sell values of one kind of animal by age and happiness and product values by happiness.
+
+        :param row: (tuple) row of the animals table
+        """
+        self._age_max = row[3]
+        self._base_val_anim = floor(row[1] / 4)
+        self._base_val_prod = row[5]
+        self._sell = []
+        self._produce = []
+        """
+        self._age_max: (integer) maximum age of the animal
+        self._base_val_anim: (integer) base value of the animal
+        self._base_val_prod: (integer) base value of the product
+        self._sell: (list) by age of lists of the sell value of an adult by happiness bucket
+        self._produce: (list) product value by happiness bucket
+        """
+
+        for age in range(self._age_max + 1):
+            self._sell.append([animal_sell_value(self._base_val_anim, self._age_max, True, age, happy)
+                               for happy in range(self._HAPPY_SELL, self._HAPPY_MAX + 1)])
+        self._produce = [animal_produce_value(self._base_val_prod, happy)
+                         for happy in range(self._HAPPY_PROD, self._HAPPY_MAX + 1)]
+
+    def sell(self, adult, age, happy):
+        """
+        :param adult: (boolean) is the animal an adult
+        :param age: (integer) age of the animal
+        :param happy: (integer) happiness of the animal
+        :return: (integer) value of the sold animal
+        """
+        if not adult:
+            return self._base_val_anim
+        if 0 <= age <= self._age_max and happy <= self._HAPPY_MAX:
+            return self._sell[age][max(happy, self._HAPPY_SELL) - self._HAPPY_SELL]
+        return animal_sell_value(self._base_val_anim, self._age_max, adult, age, happy)
+
+    def produce(self, happy):
+        """
+        :param happy: (integer) happiness of the animal
+        :return: (integer) value of the product
+        """
+        if happy <= self._HAPPY_MAX:
+            return self._produce[max(happy, self._HAPPY_PROD) - self._HAPPY_PROD]
+        return animal_produce_value(self._base_val_prod, happy)
+
+
+_TABLES = {}
+"""
+_TABLES: (dict) (table, KIND, stats) -> VegetableValues or AnimalValues, built on first use
+"""
+
+
+def _stats(table, row):
+    """
+    :param table: (str) 'vegetables' or 'animals'
+    :param row: (tuple) row of the table
+    :return: (tuple) the fields of the row the tables are built from
+    """
+    if table == 'vegetables':
+        return tuple(row[2:6])
+    return floor(row[1] / 4), row[3], row[5]
+
+
+def values(table, kind, row=None):
+    """
+    Gets the valuation tables of a kind, they are built the first time. A crop or animal bought before the catalog
+    changed passes the stats it was bought with, so it keeps its own values also when the kind changed or was deleted.
+
+    :param table: (str) 'vegetables' or 'animals'
+    :param kind: (str) name of the crop or animal
+    :param row: (tuple) stats as a row of the table, None for the row of the species catalog
+    :return: (VegetableValues or AnimalValues) tables of the kind
+    """
+    if row is None:
+        row = farm_catalog.CATALOG.row(table, kind)
+        if row is None:
+            raise KeyError(f"{kind} is not in the {table} of the species catalog")
+    key = (table, kind, _stats(table, row))
+    tables = _TABLES.get(key)
+    if tables is None:
+        tables = VegetableValues(row) if table == 'vegetables' else AnimalValues(row)
+        _TABLES[key] = tables
+    return tables
+
+
+def forget(table=None, kind=None):
+    """
+    Drops the tables of a kind, of a whole table or all of them, e.g. after the catalog changed.
+
+    :param table: (str) 'vegetables' or 'animals', None for all
+    :param kind: (str) name of the crop or animal, None for all kinds of the table
+    """
+    for key in list(_TABLES):
+        if (table is None or key[0] == table) and (kind is None or key[1] == kind):
+            del _TABLES[key]
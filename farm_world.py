@@ -0,0 +1,256 @@
+"""
+Farm matrix stored in an sqlite database, for worlds with more tiles than fit in memory.
+
+The tiles are grouped in square chunks which are pickled into the 'chunks' table of the world database. Only a limited
+number of chunks is kept in memory, the least recently used chunk is dropped when there is no room. Changed chunks are
+written back in batches, one transaction per batch. Indexing works as for the list of lists the Game normally uses,
+self._mtr[y][x], including assignment and iterating over the rows. Going over the rows needs the chunks of a full row of
+chunks in memory, so allow at least columns / chunk_size chunks.
+"""
+
+# import build in
+import pickle
+from collections import OrderedDict
+
+# import own
+import farm_sql
+
+
+TILE_BYTES = 1024
+"""
+TILE_BYTES: (integer) rough memory use of a crop or animal, used to turn a memory limit into a number of chunks
+"""
+
+
+class _RowView:
+    __slots__ = ('_grid', '_y')
+
+    def __init__(self, grid, y):
+        """
+        What self._mtr[y] returns, indexing it reads or writes the tile of the grid.
+
+        :param grid: (PagedGrid) the grid
+        :param y: (integer) index of the row
+        """
+        self._grid = grid
+        self._y = y
+
+    def __getitem__(self, x):
+        if -self._grid.columns <= x < 0:
+            x += self._grid.columns
+        return self._grid.get(x, self._y)
+
+    def __setitem__(self, x, value):
+        if -self._grid.columns <= x < 0:
+            x += self._grid.columns
+        self._grid.set(x, self._y, value)
+
+    def __len__(self):
+        return self._grid.columns
+
+    def __iter__(self):
+        grid = self._grid
+        y = self._y
+        size = grid.chunk_size
+        for cx in range(0, grid.columns, size):
+            cells = grid._chunk(y // size, cx // size, True)
+            start = (y % size) * size
+            yield from cells[start:start + min(size, grid.columns - cx)]
+
+
+class PagedGrid:
+    def __init__(self, rows, columns, path='farmworld.sql', world='default', chunk_size=32, max_chunks=1024,
+                 memory_limit=None, write_batch=64):
+        """
+        Farm matrix whose chunks are paged in and out of an sqlite database.
+
+        :param rows: (integer) number of rows
+        :param columns: (integer) number of columns
+        :param path: (str) path to the world database
+        :param world: (str) name of the world, one database can hold several
+        :param chunk_size: (integer) width and height of a chunk in tiles
+        :param max_chunks: (integer) maximum number of chunks kept in memory
+        :param memory_limit: (integer) memory in bytes the chunks may use, overrides max_chunks, see TILE_BYTES
+        :param write_batch: (integer) number of changed chunks written back per transaction
+        """
+        self.rows = rows
+        self.columns = columns
+        self.world = world
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        if memory_limit is not None:
+            self.max_chunks = max(1, memory_limit // (TILE_BYTES * chunk_size * chunk_size))
+        self.write_batch = write_batch
+        self.loads = 0
+        self.writes = 0
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._pending = {}
+        self._connection = farm_sql.create_connection(path)
+        """
+        self.rows: (integer) number of rows
+        self.columns: (integer) number of columns
+        self.world: (str) name of the world
+        self.chunk_size: (integer) width and height of a chunk in tiles
+        self.max_chunks: (integer) maximum number of chunks kept in memory
+        self.write_batch: (integer) number of changed chunks written back per transaction
+        self.loads: (integer) number of chunks read from the database
+        self.writes: (integer) number of chunks written to the database
+        self._cache: (OrderedDict) (cy, cx) -> list of tiles of the chunk, least recently used first
+        self._dirty: (set) (cy, cx) of the cached chunks that changed
+        self._pending: (dict) (cy, cx) -> list of tiles of changed chunks dropped from the cache but not written yet
+        self._connection: (sqlite3.Connection) connection to the world database
+        """
+
+        query = """CREATE TABLE IF NOT EXISTS chunks (
+        world TEXT NOT NULL,
+        cy INTEGER NOT NULL,
+        cx INTEGER NOT NULL,
+        data BLOB,
+        PRIMARY KEY(world, cy, cx)
+        );
+        """
+        farm_sql.execute_query(self._connection, query)
+
+    def _chunk(self, cy, cx, write):
+        """
+        Gets the tiles of a chunk, loading it when it is not in memory.
+
+        :param cy: (integer) row of the chunk
+        :param cx: (integer) column of the chunk
+        :param write: (boolean) the chunk may be changed and needs to be written back
+        :return: (list) of the tiles of the chunk, row major
+        """
+        key = (cy, cx)
+        cells = self._cache.get(key)
+        if cells is None:
+            cells = self._pending.pop(key, None)
+            if cells is not None:
+                self._dirty.add(key)
+            else:
+                cells = self._load(cy, cx)
+            self._cache[key] = cells
+            if len(self._cache) + len(self._pending) > self.max_chunks:
+                self._evict()
+        else:
+            self._cache.move_to_end(key)
+        if write:
+            self._dirty.add(key)
+        return cells
+
+    def _load(self, cy, cx):
+        """
+        :return: (list) of the tiles of the chunk as stored in the database, all None if it was never stored
+        """
+        query = """SELECT data FROM chunks WHERE world=? AND cy=? AND cx=?"""
+        data = farm_sql.execute_read_query_v2(self._connection, query, (self.world, cy, cx))
+        self.loads += 1
+        if data and data[0][0] is not None:
+            return pickle.loads(data[0][0])
+        return [None] * (self.chunk_size * self.chunk_size)
+
+    def _evict(self):
+        """
+        Drops the least recently used chunk from memory, it is queued for writing when it changed. The queued chunks
+        count toward max_chunks, when there is no room left they are written together with the least recently used
+        changed chunks in memory, up to write_batch chunks. Those stay in memory but no longer need writing.
+        """
+        key, cells = self._cache.popitem(last=False)
+        if key in self._dirty:
+            self._dirty.discard(key)
+            self._pending[key] = cells
+        if len(self._pending) >= self.write_batch or len(self._cache) + len(self._pending) > self.max_chunks:
+            chunks = self._pending
+            for key in self._cache:
+                if len(chunks) >= self.write_batch:
+                    break
+                if key in self._dirty:
+                    chunks[key] = self._cache[key]
+            self._dirty.difference_update(chunks)
+            self._write(chunks)
+            self._pending = {}
+
+    def _write(self, chunks):
+        """
+        Writes chunks to the database in a single transaction, an empty chunk is stored without data.
+
+        :param chunks: (dict) (cy, cx) -> list of tiles
+        """
+        query = """INSERT OR REPLACE INTO chunks (world, cy, cx, data) VALUES (?,?,?,?)"""
+        args = [(self.world, cy, cx, pickle.dumps(cells, pickle.HIGHEST_PROTOCOL) if any(cells) else None)
+                for (cy, cx), cells in chunks.items()]
+        farm_sql.execute_many(self._connection, query, args)
+        self.writes += len(chunks)
+
+    def flush(self):
+        """
+        Writes all changed chunks back to the database.
+        """
+        chunks = self._pending
+        for key in self._dirty:
+            chunks[key] = self._cache[key]
+        if chunks:
+            self._write(chunks)
+        self._pending = {}
+        self._dirty = set()
+
+    def close(self):
+        """
+        Writes all changed chunks back and closes the database.
+        """
+        self.flush()
+        self._cache.clear()
+        self._connection.close()
+
+    def _check(self, x, y):
+        """
+        Raises an IndexError when the tile is outside of the grid, it would end up in another chunk otherwise.
+        """
+        if not (0 <= x < self.columns and 0 <= y < self.rows):
+            raise IndexError(f"tile ({x}, {y}) out of range")
+
+    def peek(self, pos):
+        """
+        Reads a tile only to look at it, the crop or animal on it must not be changed.
+
+        :param pos: (tuple) (column, row) of the tile
+        :return: the crop, animal or None on the tile
+        """
+        size = self.chunk_size
+        x, y = pos
+        self._check(x, y)
+        return self._chunk(y // size, x // size, False)[(y % size) * size + x % size]
+
+    def get(self, x, y):
+        """
+        Reads a tile for changing it, its chunk will be written back.
+
+        :param x: (integer) column of the tile
+        :param y: (integer) row of the tile
+        :return: the crop, animal or None on the tile
+        """
+        size = self.chunk_size
+        self._check(x, y)
+        return self._chunk(y // size, x // size, True)[(y % size) * size + x % size]
+
+    def set(self, x, y, value):
+        """
+        :param x: (integer) column of the tile
+        :param y: (integer) row of the tile
+        :param value: the crop, animal or None to put on the tile
+        """
+        size = self.chunk_size
+        self._check(x, y)
+        self._chunk(y // size, x // size, True)[(y % size) * size + x % size] = value
+
+    def __getitem__(self, y):
+        if not -self.rows <= y < self.rows:
+            raise IndexError('row index out of range')
+        return _RowView(self, y % self.rows)
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        for y in range(self.rows):
+            yield _RowView(self, y)
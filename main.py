@@ -13,13 +13,23 @@ Click 'End day' to age and advance in game
 """
 
 # import build in
+import copy
+import os
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
 from math import floor
 
-# import other
-import pygame
-
 # import own
+import farm_catalog
 import farm_sql
+import farm_state
+import farm_value
+
+# pygame is imported on first use by _import_pygame so headless tools can use the simulation without loading it
+pygame = None
 
 
 __author__ = 'Kenrick Stadt'
@@ -29,11 +39,80 @@ __credits__ = ["Kenrick Stadt"]
 
 # from pygame.locals import *
 
+FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'font.ttf')
+FONT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'font.cache')
+
+
+def _import_pygame():
+    """
+    Imports pygame into the module namespace, only the game window needs it.
+    """
+    global pygame
+    if pygame is None:
+        import pygame as _pygame
+        pygame = _pygame
+    return pygame
+
+
+def _font_path(name='Arial'):
+    """
+    Resolves the file of the label font. A bundled 'font.ttf' next to this file is used when present, otherwise the
+    system font is looked up once and its path is remembered in 'font.cache', since scanning the system fonts is slow
+    on machines with many fonts installed.
+
+    :param name: (str) name of the system font to look for
+    :return: (str) path to the font file or None for the pygame default font
+    """
+    if os.path.isfile(FONT_FILE):
+        return FONT_FILE
+
+    try:
+        with open(FONT_CACHE) as f:
+            cached_name, _, path = f.read().partition('\n')
+        if cached_name == name and (not path or os.path.isfile(path)):
+            return path or None
+    except OSError:
+        pass
+
+    path = pygame.font.match_font(name)
+    try:
+        with open(FONT_CACHE, 'w') as f:
+            f.write(name + '\n' + (path or ''))
+    except OSError:
+        pass
+    return path
+
+
+FrameSnapshot = namedtuple('FrameSnapshot', ['seq', 'tiles', 'money', 'money_gained', 'money_timer', 'transaction',
+                                             'day', 'buy'])
+"""
+Immutable state of the farm as shown on one frame, published by the simulation and drawn by the renderer:
+    seq: (integer) increases with each published snapshot
+    tiles: (tuple) of rows with a (name, kind, sub_text) tuple per tile as given by Game._get_label_text
+    money: (integer) the amount of cash in the bank account
+    money_gained: (integer) the amount of money gained or lost in the latest transaction
+    money_timer: (integer) frames the money gained label should be shown after the latest transaction
+    transaction: (integer) increases with each transaction published by the simulation thread
+    day: (integer) day tracker
+    buy: (tuple) (KIND, price) of the selected item to buy
+"""
+
 
 class Game:
-    def __init__(self):
+    def __init__(self, startup_report=False, threaded=False, catalog_policy='keep', sprites=False, adaptive=False,
+                 cpu_report=False, seed=None):
         """
         Main class to run the farmsim game
+
+        :param startup_report: (bool) print how long each startup step took up to the first frame
+        :param threaded: (bool) run the simulation on its own thread so the window keeps drawing during long actions
+        :param catalog_policy: (str) what living crops and animals do when their kind changes in the catalog while the
+        game runs: 'keep' the stats they were bought with or 'refresh' to the new stats
+        :param sprites: (bool) draw the tiles with the sprites of farm_sprites instead of text only
+        :param adaptive: (bool) sleep until the next input while nothing is animating instead of drawing 60 frames per
+        second
+        :param cpu_report: (bool) print the cpu usage of the idle and active frames when the game is closed
+        :param seed: (integer) seed of the random yields of the crops, None gives every crop its maximum yield
         """
         self._running = True
         self._screen = None
@@ -84,13 +163,158 @@ class Game:
         self._day: (integer) day tracker
         """
 
-    def on_init(self):
-        pygame.init()
-        self._screen = pygame.display.set_mode(self.SIZE, pygame.HWSURFACE)
-        self._font = pygame.font.SysFont('Arial', self._FONT_SIZE)
+        self._startup_report = startup_report
+        self._startup_times = []
+        """
+        self._startup_report: (boolean) print the startup timing report after the first frame
+        self._startup_times: (list) of (step, time.perf_counter()) tuples marking the end of each startup step
+        """
+
+        self._threaded = threaded
+        self._sim = None
+        self._frame_transaction = 0
+        self._frame_timer = 0
+        """
+        self._threaded: (boolean) run the simulation on a SimulationThread, this game only draws and sends commands
+        self._sim: (None) will become the SimulationThread in threaded mode
+        self._frame_transaction: (integer) transaction of the last snapshot seen by the renderer
+        self._frame_timer: (integer) frames the money gained label is still shown in threaded mode
+        """
+
+        self._sharded = None
+        """
+        self._sharded: (None) will become a farm_shard.ShardedEndDay when end_day runs in the sharded mode
+        """
+
+        self._farm_value = 0
+        """
+        self._farm_value: (integer) sum of the worth of all tiles, kept up to date with each action and end_day, None
+        after a sharded end_day until it is asked for
+        """
+
+        self._catalog_policy = catalog_policy
+        self._catalog_generation = 0
+        self._CATALOG_POLL_SECONDS = 2
+        self._next_catalog_poll = 0
+        """
+        self._catalog_policy: (str) 'keep' or 'refresh', see the catalog_policy parameter
+        self._catalog_generation: (integer) generation of the species catalog this game is up to date with
+        self._CATALOG_POLL_SECONDS: (integer) seconds between checks for changes to the catalog
+        self._next_catalog_poll: (float) time.monotonic() of the next check for changes to the catalog
+        """
+
+        self._metrics = None
+        self._memory = None
+        self._market = None
+        self._market_owner = False
+        self._market_generation = 0
+        self._yield_stream = None
+        if seed is not None:
+            import farm_random
+            self._yield_stream = farm_random.YieldStream(seed)
+        """
+        self._metrics: (None) will become a farm_metrics.MetricsRecorder that records every end_day
+        self._memory: (None) will become a farm_memory.MemoryMonitor that measures every end_day
+        self._market: (None) will become the farm_market.Market the game sells on
+        self._market_owner: (boolean) this game updates the market prices at the end of the day
+        self._market_generation: (integer) generation of the market prices the buy list is priced with
+        self._yield_stream: (farm_random.YieldStream) draws the yields of the crops, None when the game is not seeded
+        """
+
+        self._sprites = sprites
+        self._atlas = None
+        self._tile_rects = None
+        self._end_day_rect = None
+        """
+        self._sprites: (boolean) draw the tiles with sprites
+        self._atlas: (None) will become the farm_sprites.TileAtlas when drawing with sprites
+        self._tile_rects: (None) will become a list of rows with the screen rectangle of each tile
+        self._end_day_rect: (None) will become the screen rectangle of the end of day 'button'
+        """
+
+        self._adaptive = adaptive
+        self._IDLE_TIMEOUT = self._CATALOG_POLL_SECONDS * 1000
+        self._frame_event = None
+        self._cpu_report = cpu_report
+        self._cpu = {'idle': [0, 0.0, 0.0], 'active': [0, 0.0, 0.0]}
+        """
+        self._adaptive: (boolean) wait for input while nothing is animating
+        self._IDLE_TIMEOUT: (integer) milliseconds to wait for input at most, so the catalog checks keep running
+        self._frame_event: (None) will become the pygame event type the simulation thread posts for a new snapshot
+        self._cpu_report: (boolean) print the cpu usage report on cleanup
+        self._cpu: (dict) 'idle' or 'active' -> [frames, wall seconds, cpu seconds] spent in those frames
+        """
+
+    def _startup_mark(self, step):
+        """
+        Marks the end of a startup step, once the first frame is drawn the report is printed.
+
+        :param step: (str) name of the step that just finished
+        """
+        if self._startup_report and self._startup_times is not None:
+            self._startup_times.append((step, time.perf_counter()))
+            if step == 'first frame':
+                start = self._startup_times[0][1]
+                previous = start
+                print('Startup timing:')
+                for name, moment in self._startup_times[1:]:
+                    print(f"  {name:<20}{(moment - previous) * 1000:8.1f} ms")
+                    previous = moment
+                print(f"  {'time to first frame':<20}{(previous - start) * 1000:8.1f} ms")
+                self._startup_times = None
+
+    def init_farm(self):
+        """
+        Creates the empty farm field and loads the buy list. This is all the game needs to run without a window, e.g.
+        for headless tools.
+        """
+        if self._sharded:
+            self._sharded.release(self)
+        self._mtr = []
         for i in range(self._ROWS):
             self._mtr.append([None] * self._COLUMNS)
+        self._catalog_generation = farm_catalog.CATALOG.generation
         self._get_buy_list()
+        self._revalue_all()
+
+    def on_init(self):
+        """
+        Opens the game window. The species catalog is loaded from the database on a separate thread while the display
+        is being initialized.
+        """
+        self._startup_mark('start')
+        _import_pygame()
+        self._startup_mark('import pygame')
+        prewarm = farm_catalog.CATALOG.prewarm()
+        pygame.display.init()
+        pygame.font.init()
+        self._screen = pygame.display.set_mode(self.SIZE, pygame.HWSURFACE)
+        self._startup_mark('display init')
+        self._font = pygame.font.Font(_font_path('Arial'), self._FONT_SIZE)
+        self._startup_mark('font')
+        self._tile_rects = [[pygame.Rect(25 + 150 * j, 25 + 120 * i, 150, 120) for j in range(self._COLUMNS)]
+                            for i in range(self._ROWS)]
+        self._end_day_rect = pygame.Rect(self.WIDTH - 115, self.HEIGHT - self._FONT_SIZE - 20, 115,
+                                         self._FONT_SIZE + 20)
+        if self._sprites:
+            import farm_sprites
+            self._atlas = farm_sprites.TileAtlas(self._font, self._FONT_SIZE)
+            self._startup_mark('sprites')
+        prewarm.join()
+        self._startup_mark('catalog')
+        if self._threaded:
+            simulation = Game(catalog_policy=self._catalog_policy,
+                              seed=self._yield_stream.seed if self._yield_stream else None)
+            simulation.monitor_memory(self._memory)
+            simulation.record_metrics(self._metrics)
+            simulation.init_farm()
+            simulation.use_market(self._market, self._market_owner)
+            self._frame_event = pygame.event.custom_type()
+            self._sim = SimulationThread(simulation, lambda: pygame.event.post(pygame.event.Event(self._frame_event)))
+            self._sim.start()
+        else:
+            self.init_farm()
+        self._startup_mark('farm')
         self._running = True
 
     def on_event(self, event):
@@ -102,6 +326,7 @@ class Game:
             Right mouse button: clear tile and sell animals;
             Scroll wheel: scroll through and switch buy_list;
             Mouse motion: detect mouse position for highlighting;
+            F9: print a memory report when the memory is monitored;
 
         Key presses w, a, s and d plus key_up, key_left, key_down and key_right are reserved for further use.
         :param event: an event from pygame.event.get()
@@ -121,29 +346,31 @@ class Game:
             elif event.key == pygame.K_RIGHT or event.key == pygame.K_d:
                 # move right
                 pass
+            elif event.key == pygame.K_F9:
+                self.memory_report()
 
         elif event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1:
                 # left mouse button
                 self.det_mouse_pos(event.pos)
-                self._action_execute()
+                self._command('action')
 
             elif event.button == 3:
                 # right mouse button
                 self.det_mouse_pos(event.pos)
-                self._clear_sell()
+                self._command('clear_sell')
 
             elif event.button == 2:
                 # middle mouse button
-                self._switch_buy_list()
+                self._command('switch_buy_list')
 
             elif event.button == 4:
                 # scroll up
-                self._buy_list_scroll(event.button)
+                self._command('scroll_up')
 
             elif event.button == 5:
                 # scroll down
-                self._buy_list_scroll(event.button)
+                self._command('scroll_down')
 
         elif event.type == pygame.MOUSEMOTION:
             self.det_mouse_pos(event.pos)
@@ -152,49 +379,88 @@ class Game:
         """
         Function to execute actions that should be preformed each loop iteration.
         If a frame timer is active reduce the number of frames by 1
-        """
-        if self._money_frame_timer > 0:
+        In threaded mode a new transaction from the simulation (re)starts the frame timer of the money gained label.
+        Every few seconds the species catalog is checked for changes.
+        """
+        now = time.monotonic()
+        if now >= self._next_catalog_poll:
+            if self._next_catalog_poll:
+                self._command('poll_catalog')
+            self._next_catalog_poll = now + self._CATALOG_POLL_SECONDS
+
+        if self._sim:
+            frame = self._sim.frame
+            if frame.transaction != self._frame_transaction:
+                self._frame_transaction = frame.transaction
+                self._frame_timer = frame.money_timer
+            if self._frame_timer > 0:
+                self._frame_timer -= 1
+
+        elif self._money_frame_timer > 0:
             self._money_frame_timer -= 1
 
     def on_render(self):
         """
         Used to put labels on to the screen and highlight the areas where the mouse is hovering.
+        Everything is drawn from a snapshot, in threaded mode the latest one published by the simulation.
         """
+        if self._sim:
+            frame = self._sim.frame
+            money_timer = self._frame_timer
+        else:
+            frame = self.snapshot()
+            money_timer = self._money_frame_timer
+
         self._screen.fill((0, 0, 0))
 
-        self._highlight()
+        if self._atlas:
+            # the tiles fill the field, so they go below the highlight and the other labels
+            self.set_labels(frame.tiles)
+            self._highlight(3)
+        else:
+            self._highlight()
 
-        label_money = self._font.render('Money: ' + str(self._money), True, (255, 255, 0))
+        label_money = self._font.render('Money: ' + str(frame.money), True, (255, 255, 0))
         self._screen.blit(label_money, (10, self.HEIGHT - self._FONT_SIZE - 10))
 
         label_end_day = self._font.render('End the _day', True, (255, 255, 255))
         self._screen.blit(label_end_day, (self.WIDTH - 75, self.HEIGHT - self._FONT_SIZE - 10))
 
-        label_buy = self._font.render('Buy: ' + self._buy[0] + ' (' + str(self._buy[1]) + ')', True, (255, 255, 255))
+        label_buy = self._font.render('Buy: ' + frame.buy[0] + ' (' + str(frame.buy[1]) + ')', True, (255, 255, 255))
         self._screen.blit(label_buy, (floor(self.WIDTH / 3), self.HEIGHT - self._FONT_SIZE - 10))
 
-        label_day = self._font.render('Day: ' + str(self._day), True, (255, 255, 255))
+        label_day = self._font.render('Day: ' + str(frame.day), True, (255, 255, 255))
         self._screen.blit(label_day, (floor(self.WIDTH / 2), self._FONT_SIZE))
 
-        if self._money_frame_timer:
-            if self._money_gained < 0:
-                text = ' - ' + str(-self._money_gained)
+        if money_timer:
+            if frame.money_gained < 0:
+                text = ' - ' + str(-frame.money_gained)
                 rgb = (255, 0, 0)
             else:
-                text = ' + ' + str(self._money_gained)
+                text = ' + ' + str(frame.money_gained)
                 rgb = (255, 255, 0)
             label_gained = self._font.render(text, True, rgb)
             self._screen.blit(label_gained, (50, self.HEIGHT - self._FONT_SIZE * 3))
 
-        self.set_labels()
+        if not self._atlas:
+            self.set_labels(frame.tiles)
 
         pygame.display.update()
 
     def on_cleanup(self):
         """
-        Function to quit all PyGame modules
+        Function to stop the simulation thread, if any, and quit all PyGame modules
         """
-        pygame.quit()
+        if self._cpu_report:
+            print('CPU usage:')
+            for state, (frames, wall, cpu) in self._cpu.items():
+                usage = cpu / wall * 100 if wall else 0
+                print(f"  {state:<7}{frames:8d} frames {wall:8.1f} s {cpu:8.2f} s cpu {usage:6.1f} % of a core")
+        if self._sim:
+            self._sim.stop()
+            self._sim = None
+        if pygame is not None:
+            pygame.quit()
 
     def on_execute(self):
         """
@@ -202,19 +468,47 @@ class Game:
         events will be checked and the corresponding actions taken. The on_loop actions will be executed to finally
         update the screen.
         An internal PyGame clock is used to set the game to 60 frames per second
+        In the adaptive mode the loop sleeps until the next event while nothing is animating, input, a new snapshot
+        of the simulation thread or the timeout for the catalog check wake it up again.
         """
         if self.on_init() == False:
             self._running = False
 
+        clock = pygame.time.Clock()
         while self._running:
-            for event in pygame.event.get():
+            start = time.perf_counter()
+            start_cpu = time.process_time()
+            idle = self._adaptive and not self._animating()
+            if idle:
+                event = pygame.event.wait(self._IDLE_TIMEOUT)
+                events = pygame.event.get()
+                if event.type != pygame.NOEVENT:
+                    events.insert(0, event)
+            else:
+                events = pygame.event.get()
+
+            for event in events:
                 self.on_event(event)
             self.on_loop()
             self.on_render()
-            pygame.time.Clock().tick(self.FPS)
+            self._startup_mark('first frame')
+            clock.tick(0 if idle else self.FPS)
+
+            usage = self._cpu['idle' if idle else 'active']
+            usage[0] += 1
+            usage[1] += time.perf_counter() - start
+            usage[2] += time.process_time() - start_cpu
 
         self.on_cleanup()
 
+    def _animating(self):
+        """
+        :return: (boolean) a label is being animated, so frames need to be drawn at the full rate
+        """
+        if self._sim:
+            return self._frame_timer > 0 or not self._sim.commands.empty()
+        return self._money_frame_timer > 0
+
     def det_mouse_pos(self, pos):
         """
         When called will detect the mouse position, clicked or moving, by evaluating the x and y coordinates.
@@ -241,19 +535,120 @@ class Game:
         else:
             self._mouse_pos = None
 
-    def _get_buy_list(self):
+    def snapshot(self, seq=0):
+        """
+        Creates an immutable snapshot of everything that is drawn on a frame.
+
+        :param seq: (integer) sequence number of the snapshot
+        :return: (FrameSnapshot) of the current state
+        """
+        tiles = tuple(tuple(self._get_label_text((j, i)) for j in range(self._COLUMNS)) for i in range(self._ROWS))
+        return FrameSnapshot(seq, tiles, self._money, self._money_gained, self._money_frame_timer, 0, self._day,
+                             self._buy)
+
+    def execute(self, command, pos=None):
+        """
+        Performs one of the player actions, these are the verbs the input events are translated into.
+            action: the left mouse button action for the position, see _action_execute
+            clear_sell: clear the tile or sell the animal on the position, see _clear_sell
+            buy: buy the selected crop or animal for the position if it is empty, see _buy_crop_animal
+            switch_buy_list, scroll_up, scroll_down: change the selected item to buy
+            end_day: end the day
+
+        :param command: (str) name of the action
+        :param pos: (tuple) (column, row) of the tile or a 'button' as given by det_mouse_pos, None keeps the current
+        """
+        if pos is not None:
+            self._mouse_pos = pos
+        if self._market and self._market.generation != self._market_generation:
+            self._get_buy_list(self._buy[0])
+
+        if command == 'action':
+            self._action_execute()
+        elif command == 'clear_sell':
+            if type(self._mouse_pos) == tuple:
+                self._clear_sell()
+        elif command == 'buy':
+            if type(self._mouse_pos) == tuple and self._peek(self._mouse_pos) is None:
+                self._buy_crop_animal()
+        elif command == 'switch_buy_list':
+            self._switch_buy_list()
+        elif command == 'scroll_up':
+            self._buy_list_scroll(4)
+        elif command == 'scroll_down':
+            self._buy_list_scroll(5)
+        elif command == 'end_day':
+            self.end_day()
+        elif command == 'poll_catalog':
+            self.poll_catalog()
+
+    def _command(self, command):
         """
-        When called will import the name and price from the corresponding type table in the sql database.
+        Performs the action for the current mouse position, in threaded mode it is sent to the simulation instead.
+
+        :param command: (str) name of the action, see execute
+        """
+        if self._sim:
+            self._sim.send(command, self._mouse_pos)
+        else:
+            self.execute(command)
+
+    def poll_catalog(self, check=True):
+        """
+        Picks up the changes to the species catalog. The buy list is reloaded when its kinds changed and, with the
+        'refresh' policy, the living crops and animals of the changed kinds get the new stats. With the 'keep' policy
+        they keep the stats they were bought with, only new purchases get the new stats.
+
+        :param check: (bool) check the database for changes first, False when the caller just polled the catalog
+        :return: (dict) table -> set of the kinds that changed
+        """
+        catalog = farm_catalog.CATALOG
+        if check:
+            catalog.poll()
+        changes = catalog.changes_since(self._catalog_generation)
+        self._catalog_generation = catalog.generation
+        if not changes:
+            return changes
+
+        for table, kinds in changes.items():
+            for kind in kinds:
+                farm_value.forget(table, kind)
+
+        if changes.get(self._buy_type):
+            self._get_buy_list(self._buy[0])
+
+        if self._catalog_policy == 'refresh':
+            for rows in self._mtr:
+                for tile in rows:
+                    table = 'vegetables' if isinstance(tile, Vegetable) else 'animals'
+                    if tile and tile.KIND in changes.get(table, ()) and catalog.row(table, tile.KIND):
+                        if table == 'vegetables':
+                            tile.refresh(seeded=self._yield_stream is not None)
+                        else:
+                            tile._get_sql_data()
+            self._revalue_all()
+        return changes
+
+    def _get_buy_list(self, selected=None):
+        """
+        When called will import the name and price from the corresponding type table in the species catalog. When the
+        game sells on a market the prices are the market prices.
+
+        :param selected: (str) KIND to keep selected, the first item is selected when it is None or not in the list
         """
         if self._buy_type is None:
             self._buy_type = 'vegetables'
 
-        connection = farm_sql.create_connection('farmsim.sql')
-        query = """SELECT KIND, price FROM """ + self._buy_type
-
-        self._buy_list = farm_sql.execute_read_query(connection, query, feedback=True)
+        self._buy_list = farm_catalog.CATALOG.buy_list(self._buy_type)
+        if self._market:
+            self._buy_list = [(kind, self._market.buy_price(self._buy_type, kind, price))
+                              for kind, price in self._buy_list]
+            self._market_generation = self._market.generation
         self._buy = self._buy_list[0]
-        connection.close()
+        for item in self._buy_list:
+            if item[0] == selected:
+                self._buy = item
+                break
 
     def _buy_list_scroll(self, up_down):
         """
@@ -304,43 +699,42 @@ class Game:
         """
         # y = [5 + 150 * y, 5 + 150 * (y + 1)]
         # x = [5 + 120 * x, 5 + 120 * (x + 1)]
-        x = coordinates[0]
-        y = coordinates[1]
+        tile = self._peek(coordinates)
         sub_text = ''
 
-        if isinstance(self._mtr[y][x], Vegetable):
-            name = self._mtr[y][x].KIND
+        if isinstance(tile, Vegetable):
+            name = tile.KIND
             kind = 'Vegetable'
 
-            if self._mtr[y][x].dead:
+            if tile.dead:
                 sub_text = 'Dead'
-            elif self._mtr[y][x].days_grown == 0:
+            elif tile.days_grown == 0:
                 sub_text = 'Planted'
-            elif self._mtr[y][x].harvest:
+            elif tile.harvest:
                 sub_text = 'Harvest'
-            elif self._mtr[y][x].days_grown:
+            elif tile.days_grown:
                 sub_text = 'Growing'
 
-            if self._mtr[y][x].watered:
+            if tile.watered:
                 sub_text += ', watered'
 
-        elif isinstance(self._mtr[y][x], Animal):
-            name = self._mtr[y][x].KIND
+        elif isinstance(tile, Animal):
+            name = tile.KIND
             kind = 'Animal'
-            if self._mtr[y][x].dead:
+            if tile.dead:
                 sub_text = 'Dead'
             else:
-                if self._mtr[y][x].harvest and self._mtr[y][x].adult:
+                if tile.harvest and tile.adult:
                     sub_text = 'Produce'
-                elif self._mtr[y][x].adult:
+                elif tile.adult:
                     sub_text = 'Adult'
                 else:
                     sub_text = 'Youngster'
 
-                if self._mtr[y][x].fed:
+                if tile.fed:
                     sub_text += ' Fed'
 
-                if self._mtr[y][x].petted:
+                if tile.petted:
                     sub_text += ' Petted'
 
         else:
@@ -350,14 +744,30 @@ class Game:
 
         return name, kind, sub_text
 
-    def set_labels(self):
+    def set_labels(self, tiles=None):
         """
         When called creates the labels for each of the farm tiles. Colors depend on the type and if the animal or crop
         on that tile is dead or not.
+
+        With sprites the composed tile surfaces of the atlas are drawn in a single blits call.
+
+        :param tiles: (tuple) of rows with the label texts per tile as in FrameSnapshot.tiles, None to determine them
         """
+        if self._atlas:
+            blits = []
+            for i in range(self._ROWS):
+                for j in range(self._COLUMNS):
+                    label = tiles[i][j] if tiles else self._get_label_text((j, i))
+                    blits.append((self._atlas.tile(*label), self._tile_rects[i][j]))
+            self._screen.blits(blits, False)
+            return
+
         for i in range(self._ROWS):
             for j in range(self._COLUMNS):
-                name, kind, stage = self._get_label_text((j, i))
+                if tiles:
+                    name, kind, stage = tiles[i][j]
+                else:
+                    name, kind, stage = self._get_label_text((j, i))
                 x = 75 + 150 * j
                 y = 50 + 120 * i
 
@@ -380,27 +790,23 @@ class Game:
                     label = self._font.render(stage, True, rgb)
                     self._screen.blit(label, (x, y + 5 + self._FONT_SIZE))
 
-    def _highlight(self):
+    def _highlight(self, width=0):
         """
         Function that draws a highlighting rectangle on a clickable area where the mouse is positioned.
+
+        :param width: (integer) width of the border, 0 fills the rectangle
         """
         rgb = (45, 163, 186)
         rect = None
         if self._mouse_pos == 'save':
             pass
         elif self._mouse_pos == 'end _day':
-            rect = (self.WIDTH - 115,
-                    self.HEIGHT - self._FONT_SIZE - 20,
-                    115,
-                    self._FONT_SIZE + 20)
+            rect = self._end_day_rect
         elif type(self._mouse_pos) == tuple:
-            rect = (25 + 150 * self._mouse_pos[0],
-                    25 + 120 * self._mouse_pos[1],
-                    150,
-                    120)
+            rect = self._tile_rects[self._mouse_pos[1]][self._mouse_pos[0]]
 
         if rect:
-            pygame.draw.rect(self._screen, rgb, rect)
+            pygame.draw.rect(self._screen, rgb, rect, width)
 
     def _action_execute(self):
         """"
@@ -434,15 +840,17 @@ class Game:
         elif type(self._mouse_pos) == tuple:
             pos = self._mouse_pos
 
-            if self._mtr[pos[1]][pos[0]] is None:
+            if self._peek(pos) is None:
                 self._buy_crop_animal()
 
-            elif isinstance(self._mtr[pos[1]][pos[0]], Vegetable):
+            elif isinstance(self._peek(pos), Vegetable):
                 self._action_vegetable(pos)
 
-            elif isinstance(self._mtr[pos[1]][pos[0]], Animal):
+            elif isinstance(self._peek(pos), Animal):
                 self._action_animal(pos)
 
+            self._revalue(pos)
+
     def _action_vegetable(self, pos):
         """
         When called checks if the vegetable on the given position is dead, then determines if it can be harvested and
@@ -456,9 +864,12 @@ class Game:
             self._clear_sell()
 
         elif self._mtr[pos[1]][pos[0]].harvest:
-            self._mtr[pos[1]][pos[0]].harvest_crop()
-            self._money_gained = self._mtr[pos[1]][pos[0]].value
-            self._money += self._mtr[pos[1]][pos[0]].value
+            crop = self._mtr[pos[1]][pos[0]]
+            crop.harvest_crop()
+            self._money_gained = crop.value
+            if self._market:
+                self._money_gained = self._market.sell('vegetables', crop.KIND, crop.value, crop._yield)
+            self._money += self._money_gained
             self._money_frame_timer = self.F_TIMER
 
         elif not self._mtr[pos[1]][pos[0]].watered:
@@ -482,6 +893,8 @@ class Game:
 
         elif self._mtr[pos[1]][pos[0]].harvest:
             self._money_gained = self._mtr[pos[1]][pos[0]].get_produce()
+            if self._market:
+                self._money_gained = self._market.sell('products', self._peek(pos).KIND, self._money_gained)
             self._money += self._money_gained
             self._money_frame_timer = self.F_TIMER
 
@@ -500,9 +913,14 @@ class Game:
         if isinstance(self._mtr[self._mouse_pos[1]][self._mouse_pos[0]], Animal) and not \
                 self._mtr[self._mouse_pos[1]][self._mouse_pos[0]].dead:
             self._money_gained = self._mtr[self._mouse_pos[1]][self._mouse_pos[0]].sell()
+            if self._market:
+                self._money_gained = self._market.sell('animals', self._peek(self._mouse_pos).KIND,
+                                                       self._money_gained)
             self._money += self._money_gained
             self._money_frame_timer = 2 * self.FPS + 1
 
+        if self._peek(self._mouse_pos) and self._farm_value is not None:
+            self._farm_value -= self._peek(self._mouse_pos).last_worth
         self._mtr[self._mouse_pos[1]][self._mouse_pos[0]] = None
 
     def _buy_crop_animal(self):
@@ -519,16 +937,272 @@ class Game:
             self._money_gained = -self._buy[1]
             self._money -= self._buy[1]
             self._money_frame_timer = self.F_TIMER
+            self._revalue(self._mouse_pos)
+
+    def use_sharded_end_day(self, shard_rows=64, workers=None):
+        """
+        Switches end_day to the sharded mode in which the farm rows are advanced on a process pool, see farm_shard.
+        Only worth it for huge farms, it needs numpy.
+
+        :param shard_rows: (integer) number of farm rows per shard, None switches back to the serial mode
+        :param workers: (integer) number of worker processes, None uses the number of cpus
+        """
+        if self._sharded:
+            self._sharded.release(self)
+            self._sharded.close()
+            self._sharded = None
+        if shard_rows:
+            import farm_shard
+            self._sharded = farm_shard.ShardedEndDay(shard_rows, workers)
 
     def end_day(self):
         """
         When called will end the _day an for each tile preform its end_day function.
         """
+        if self._memory:
+            with self._memory.measure('end_day'):
+                self._end_day()
+        else:
+            self._end_day()
+        if self._market and self._market_owner:
+            self._market.update()
+            self._get_buy_list(self._buy[0])
+
+    def _end_day(self):
+        """
+        Ends the day, see end_day.
+        """
+        if self._sharded:
+            self._sharded.run(self)
+            # determined when it is asked for, going over all the tiles would unpack the whole farm every day
+            self._farm_value = None
+            if self._metrics:
+                self._metrics.record(self)
+            return
+
         self._day += 1
-        for rows in self._mtr:
-            for i in rows:
+        total = 0
+        stream = self._yield_stream
+        ripe = []
+        for y, rows in enumerate(self._mtr):
+            for x, i in enumerate(rows):
                 if i:
                     i.end_day()
+                    if stream and i.harvest and not i.dead and type(i) is Vegetable \
+                            and i.days_grown == i._days_to_grow:
+                        ripe.append((y, x, i._produce))
+                    i.last_worth = i.worth()
+                    total += i.last_worth
+        if ripe:
+            # the yields of all the crops that became ready today are drawn at once, the same as farm_shard does
+            counts = stream.yields(self._day, [y * self._COLUMNS + x for y, x, _ in ripe],
+                                   [produce for _, _, produce in ripe])
+            for (y, x, _), count in zip(ripe, counts.tolist()):
+                # looked up again by position, a stored farm may have written the chunk of the crop away meanwhile
+                i = self._mtr[y][x]
+                i._yield = count
+                total -= i.last_worth
+                i.last_worth = i.worth()
+                total += i.last_worth
+        self._farm_value = total
+        if self._metrics:
+            self._metrics.record(self)
+
+    def use_market(self, market, owner=True):
+        """
+        Sells the harvests, products and animals on a market whose prices follow the supply, see farm_market. The buy
+        prices follow the market as well, the farm value stays at the base prices.
+
+        :param market: (farm_market.Market) the market, None to go back to the fixed prices
+        :param owner: (bool) this game updates the prices at the end of its day, False when the market is shared and
+        updated by its owner, e.g. farm_server
+        """
+        self._market = market
+        self._market_owner = owner
+        if self._buy_list is not None:
+            self._get_buy_list(self._buy[0])
+
+    def record_metrics(self, recorder):
+        """
+        Records the metrics of the farm at the end of every day, see farm_metrics.
+
+        :param recorder: (farm_metrics.MetricsRecorder) the recorder, None to stop recording
+        """
+        self._metrics = recorder
+        if self._sim:
+            # the days of a threaded game end in its simulation game
+            self._sim.game.record_metrics(recorder)
+
+    def monitor_memory(self, monitor):
+        """
+        Measures the peak memory of every end_day and allows a memory report with the F9 key, see farm_memory.
+
+        :param monitor: (farm_memory.MemoryMonitor) the monitor, None to stop measuring
+        """
+        self._memory = monitor
+
+    def memory_report(self):
+        """
+        Prints the memory per subsystem and the growth since the previous report, when the memory is monitored.
+        """
+        if self._memory:
+            self._memory.snapshot(f"day {self._day}", self)
+            self._memory.report()
+
+    def farm_value(self):
+        """
+        What the farm would bring in right now: the sell value of the living animals plus the value of the crops and
+        animal products that can be harvested. It is kept up to date as the farm changes, so this is cheap to call on
+        every frame.
+
+        :return: (integer) value of the farm
+        """
+        if self._farm_value is None:
+            self._revalue_all()
+        return self._farm_value
+
+    def _revalue(self, pos):
+        """
+        Updates the worth of a single tile after it changed.
+
+        :param pos: (tuple) (column, row) of the tile
+        """
+        tile = self._mtr[pos[1]][pos[0]]
+        if tile and self._farm_value is not None:
+            value = tile.worth()
+            self._farm_value += value - tile.last_worth
+            tile.last_worth = value
+
+    def _revalue_all(self):
+        """
+        Determines the worth of all the tiles again.
+        """
+        total = 0
+        for rows in self._mtr:
+            for tile in rows:
+                if tile:
+                    tile.last_worth = tile.worth()
+                    total += tile.last_worth
+        self._farm_value = total
+
+    def _peek(self, pos):
+        """
+        Reads a tile only to look at it, a copy-on-write farm matrix then does not need to copy the crop or animal.
+
+        :param pos: (tuple) (column, row) of the tile
+        :return: the crop, animal or None on the tile
+        """
+        peek = getattr(self._mtr, 'peek', None)
+        if peek:
+            return peek(pos)
+        return self._mtr[pos[1]][pos[0]]
+
+    def use_world_store(self, grid):
+        """
+        Plays on a farm stored in a database, see farm_world, instead of one held in memory. Call it after init_farm,
+        the farm value is determined once by going over all the tiles.
+
+        :param grid: (farm_world.PagedGrid) the stored farm
+        """
+        if self._sharded:
+            self._sharded.release(self)
+        self._ROWS, self._COLUMNS = grid.rows, grid.columns
+        self._mtr = grid
+        self._revalue_all()
+
+    def fork(self):
+        """
+        Forks the simulation for what-if questions, e.g. harvest now or wait a day. The fork is made in constant time,
+        the farm matrix becomes a farm_state.CowGrid and the fork and this game only copy the rows and the crops or
+        animals they change. The fork has no window and should be discarded when it is no longer needed.
+
+        :return: (Game) the fork
+        """
+        if self._sharded:
+            self._sharded.release(self)
+        if not isinstance(self._mtr, farm_state.CowGrid):
+            self._mtr = farm_state.CowGrid.adopt(self._mtr)
+        other = copy.copy(self)
+        other._mtr = self._mtr.fork()
+        other._screen = None
+        other._sim = None
+        other._sharded = None
+        # the metrics and memory peaks of what-if days would be mixed up with those of the real game
+        other._metrics = None
+        other._memory = None
+        if self._market:
+            # what-if sales of the fork must not move the prices of the real market
+            other._market = copy.deepcopy(self._market)
+        other._startup_times = None
+        return other
+
+    def discard(self):
+        """
+        Stops using a fork, its farm matrix is released so everything only it was holding on to can be freed.
+        """
+        if isinstance(self._mtr, farm_state.CowGrid):
+            self._mtr.discard()
+        self._mtr = []
+        self._running = False
+
+
+class SimulationThread(threading.Thread):
+    def __init__(self, game, notify=None):
+        """
+        Runs the simulation of a headless game on its own thread. Commands come in through a queue and after each of
+        them a new FrameSnapshot is published, the renderer only ever reads the latest snapshot. Long actions such as
+        ending the day on a big farm therefore do not stop the window from drawing and handling input.
+
+        :param game: (Game) game on which init_farm has been called, only this thread may touch it afterwards
+        :param notify: (function) called after a new snapshot is published, e.g. to wake up a waiting renderer
+        """
+        super().__init__(name='simulation', daemon=True)
+        self.game = game
+        self.commands = queue.Queue()
+        self.frame = game.snapshot()
+        self._notify = notify
+        """
+        self.game: (Game) the simulated game
+        self.commands: (queue.Queue) of (command, pos) tuples, None stops the thread
+        self.frame: (FrameSnapshot) latest published snapshot, replaced as a whole so readers never see a partial one
+        self._notify: (function) called after a new snapshot is published
+        """
+
+    def send(self, command, pos=None):
+        """
+        Queues a command for the simulation, see Game.execute
+
+        :param command: (str) name of the action
+        :param pos: (tuple) the mouse position the action is for
+        """
+        self.commands.put((command, pos))
+
+    def stop(self):
+        """
+        Stops the thread after the commands already queued.
+        """
+        self.commands.put(None)
+        self.join()
+
+    def run(self):
+        seq = 0
+        transaction = 0
+        money_timer = 0
+        while True:
+            item = self.commands.get()
+            if item is None:
+                break
+            command, pos = item
+            self.game.execute(command, pos)
+            if self.game._money_frame_timer:
+                # the renderer counts the frames of the label itself, the simulation only signals a new transaction
+                transaction += 1
+                money_timer = self.game._money_frame_timer
+                self.game._money_frame_timer = 0
+            seq += 1
+            self.frame = self.game.snapshot(seq)._replace(money_timer=money_timer, transaction=transaction)
+            if self._notify:
+                self._notify()
 
 
 class Vegetable:
@@ -539,7 +1213,6 @@ class Vegetable:
         todo: rework how quality works
         todo: rework how watering works --> not watering kills the crop
         todo: implement some sort of fertilizer effect
-        todo: implement semi random yield
 
         :param kind: (str) containing the name of the crop
         """
@@ -548,6 +1221,7 @@ class Vegetable:
         self._basic_val = None
         self._produce = None
         self._multi_grow = None
+        self._values = None
 
         """
         self.KIND: (string) name fo the type of crop
@@ -555,6 +1229,7 @@ class Vegetable:
         self._basic_val: (None) will become an integer with the basic value of the crop
         self._produce: (None) will become an integer of the maximum crops harvested from the plant per harvest 
         self._multi_grow: (None) will become an integer with the amount of times the crop can be harvested
+        self._values: (None) will become the farm_value.VegetableValues of the crop
         """
 
         self._quality = 1.0
@@ -564,6 +1239,10 @@ class Vegetable:
         self.harvest = False
         self.value = 0
         self._times_grown = 0
+        self._quality_steps = 0
+        self._steps_valid = True
+        self.last_worth = 0
+        self._yield = None
         """
         self._quality: (float) determines the quality of the crop
         self.days_grown: (integer) keeps track of how many days the crop has grown
@@ -571,26 +1250,69 @@ class Vegetable:
         self.harvest: (boolean) determines if the crop can be harvested or not
         self.value: (integer) used to set the value of the harvested crop
         self._times_grown: (integer) determines how many times the crop has been harvested
+        self._quality_steps: (integer) number of times the quality increased, used to look up the harvest value
+        self._steps_valid: (boolean) the quality steps were all counted at the current days_to_grow, otherwise the
+        harvest is valued from the quality itself
+        self.last_worth: (integer) worth of the crop as last counted in the farm value of the game
+        self._yield: (None) will become an integer with the number of crops of the next harvest, the maximum unless a
+        seeded game drew it when the crop became ready
         """
 
         self._get_sql_data()
+        self._yield = self._produce
 
     def _get_sql_data(self):
         """
         Gets the SQL data from the vegetable table corresponding to the type of crop and sets the corresponding
         variables
         """
-        query = """SELECT * FROM vegetables WHERE KIND=?"""
-        tup = (self.KIND,)
-        conn = farm_sql.create_connection('farmsim.sql')
-        data = farm_sql.execute_read_query_v2(conn, query, tup)
+        data = farm_catalog.CATALOG.row('vegetables', self.KIND)
 
-        self._days_to_grow = data[0][2]
-        self._basic_val = data[0][3]
-        self._produce = data[0][4]
-        self._multi_grow = data[0][5]
+        self._days_to_grow = data[2]
+        self._basic_val = data[3]
+        self._produce = data[4]
+        self._multi_grow = data[5]
+        self._values = farm_value.values('vegetables', self.KIND, data)
+
+    def __copy__(self):
+        """
+        A copy, e.g. by farm_state.CowGrid, shares the valuation tables of the crop
+        """
+        other = Vegetable.__new__(Vegetable)
+        other.__dict__.update(self.__dict__)
+        return other
+
+    def __getstate__(self):
+        """
+        The valuation tables are left out when the crop is pickled, e.g. by the farm_world store
+        """
+        state = self.__dict__.copy()
+        del state['_values']
+        return state
 
-        conn.close()
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # built from the stats of the crop itself, which are those it was bought with under the 'keep' policy
+        self._values = farm_value.values('vegetables', self.KIND, (self.KIND, None, self._days_to_grow,
+                                                                   self._basic_val, self._produce, self._multi_grow))
+        if self.__dict__.get('_yield') is None:
+            self._yield = self._produce
+        self.__dict__.setdefault('_steps_valid', True)
+
+    def refresh(self, seeded=False):
+        """
+        Takes over the new stats of the kind after the species catalog changed, with the 'refresh' policy. Steps
+        counted at the old days_to_grow no longer match the harvest table, so the harvest is then valued from the
+        quality itself.
+
+        :param seeded: (bool) the game draws the yields, a yield drawn for a crop that is ready to harvest is kept
+        """
+        days_to_grow = self._days_to_grow
+        self._get_sql_data()
+        if self._days_to_grow != days_to_grow and self._quality_steps:
+            self._steps_valid = False
+        if not (seeded and self.harvest):
+            self._yield = self._produce
 
     def end_day(self):
         """
@@ -605,6 +1327,7 @@ class Vegetable:
                 self.harvest = True
             if self.watered:
                 self._quality += 1 / self._days_to_grow
+                self._quality_steps += 1
                 self.watered = False
 
     def water(self):
@@ -620,13 +1343,22 @@ class Vegetable:
         """
         if self.harvest:
             self._times_grown += 1
-            self.value = floor(self._produce * self._basic_val * self._quality)
+            self.value = self._values.harvest(self._quality_steps if self._steps_valid else -1, self._quality,
+                                              self._yield)
             if self._times_grown < self._multi_grow:
                 self.days_grown = 1
                 self.harvest = False
             else:
                 self.dead = True
 
+    def worth(self):
+        """
+        :return: (integer) the value of the harvest if the crop can be harvested, otherwise 0
+        """
+        if self.harvest and not self.dead:
+            return self._values.harvest(self._quality_steps if self._steps_valid else -1, self._quality, self._yield)
+        return 0
+
 
 class Animal:
     def __init__(self, kind='Cow'):
@@ -643,6 +1375,7 @@ class Animal:
         self._BASE_VAL_ANIM = None
         self._BASE_VAL_PROD = None
         self._DAYS_TO_PROD = None
+        self._values = None
         """
         self.KIND: (str) with the name of the type of animal used to get all the animals data
         
@@ -660,6 +1393,9 @@ class Animal:
         
         self._DAYS_TO_PROD: (none) will become an integer that determines production speed used to determine if the 
         animal has a product ready to be collected
+
+        self._values: (None) will become the farm_value.AnimalValues of the animal used to look up the product and sell
+        values
         """
 
         self._days_since_product = 0
@@ -671,6 +1407,7 @@ class Animal:
         self.dead = False
         self.harvest = False
         self.adult = False
+        self.last_worth = 0
         """
         self._days_since_product: (integer) with the days since the animal last produced
         self._happy: (integer) the happiness of the animal 
@@ -681,6 +1418,7 @@ class Animal:
         self.dead: (boolean) used to mark if the animal died or not
         self.harvest: (boolean) used to mark if the animal has a product to gather
         self.adult: (boolean) used to check if the animal is an adult or not
+        self.last_worth: (integer) worth of the animal as last counted in the farm value of the game
         """
 
         self._get_sql_data()
@@ -690,18 +1428,37 @@ class Animal:
         Gets the SQL data from the animals table corresponding to the type of animal and sets the corresponding
         variables
         """
-        query = """SELECT * FROM animals WHERE KIND=?"""
-        tup = (self.KIND,)
-        conn = farm_sql.create_connection()
-        data = farm_sql.execute_read_query_v2(conn, query, tup)
+        data = farm_catalog.CATALOG.row('animals', self.KIND)
 
-        self._AGE_ADULT = data[0][2]
-        self._AGE_MAX = data[0][3]
-        self._BASE_VAL_ANIM = floor(data[0][1] / 4)
-        self._BASE_VAL_PROD = data[0][5]
-        self._DAYS_TO_PROD = data[0][4]
+        self._AGE_ADULT = data[2]
+        self._AGE_MAX = data[3]
+        self._BASE_VAL_ANIM = floor(data[1] / 4)
+        self._BASE_VAL_PROD = data[5]
+        self._DAYS_TO_PROD = data[4]
+        self._values = farm_value.values('animals', self.KIND, data)
 
-        conn.close()
+    def __copy__(self):
+        """
+        A copy, e.g. by farm_state.CowGrid, shares the valuation tables of the animal
+        """
+        other = Animal.__new__(Animal)
+        other.__dict__.update(self.__dict__)
+        return other
+
+    def __getstate__(self):
+        """
+        The valuation tables are left out when the animal is pickled, e.g. by the farm_world store
+        """
+        state = self.__dict__.copy()
+        del state['_values']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # built from the stats of the animal itself, which are those it was bought with under the 'keep' policy
+        self._values = farm_value.values('animals', self.KIND, (self.KIND, self._BASE_VAL_ANIM * 4, self._AGE_ADULT,
+                                                                self._AGE_MAX, self._DAYS_TO_PROD,
+                                                                self._BASE_VAL_PROD))
 
     def feed(self):
         """
@@ -718,15 +1475,12 @@ class Animal:
     def get_produce(self):
         """
         If the animal is an adult and has produced its product, it can be harvested. Its value is calculated by the
-        happiness of the animal and the product's base value
+        happiness of the animal and the product's base value, see farm_value.animal_produce_value
         :return: prod_val (integer) the value of the gathered product
         """
         if self.harvest:
             self.harvest = False
-            if self._happy < 25:
-                prod_val = self._BASE_VAL_PROD
-            else:
-                prod_val = floor(self._happy / 25 * self._BASE_VAL_PROD)
+            prod_val = self._values.produce(self._happy)
         return prod_val
 
     def sell(self):
@@ -734,23 +1488,22 @@ class Animal:
         Getting rid of your animal by selling it returns some of its costs. First the animal must be an adult to get
         more value. Then the age up to 1/2 its maximum age will increase its value if the animal is older it will go
         down again. A happy animal is worth more.
-        Finally the value of the animal will be rounded down.
+        Finally the value of the animal will be rounded down, see farm_value.animal_sell_value
         :return: val: (integer) value of the sold animal
         """
-        val = self._BASE_VAL_ANIM
-        if self.adult:
-            if self.age * 2 / (self._AGE_MAX / 2) > 1 and self.age <= (self._AGE_MAX / 2):
-                val = val * self.age * 2 / (self._AGE_MAX / 2)
-
-            elif (self._AGE_MAX - self.age) * 2 / (self._AGE_MAX / 2) > 1 and self.age >= (self._AGE_MAX / 2):
-                val = val * (self._AGE_MAX - self.age) * 2 / (self._AGE_MAX / 2)
-
-            if self._happy > 50:
-                val = val * self._happy / 50
+        return self._values.sell(self.adult, self.age, self._happy)
 
-            val = floor(val)
-
-        return val
+    def worth(self):
+        """
+        :return: (integer) the sell value of the animal plus the value of its product if it can be collected, 0 for a
+        dead animal
+        """
+        if self.dead:
+            return 0
+        value = self._values.sell(self.adult, self.age, self._happy)
+        if self.harvest:
+            value += self._values.produce(self._happy)
+        return value
 
     def end_day(self):
         """
@@ -797,6 +1550,23 @@ class Animal:
 
 
 if __name__ == '__main__':
-    theGame = Game()
+    if '--sql-log' in sys.argv:
+        farm_sql.enable_diagnostics()
+    memory = None
+    if '--memory' in sys.argv:
+        import farm_memory
+        # importing pygame under tracemalloc takes seconds, its modules would only count as 'other' anyway
+        _import_pygame()
+        memory = farm_memory.MemoryMonitor()
+    theGame = Game(startup_report='--timing' in sys.argv, threaded='--threaded' in sys.argv,
+                   sprites='--sprites' in sys.argv, adaptive='--adaptive' in sys.argv,
+                   cpu_report='--cpu-report' in sys.argv,
+                   seed=int(sys.argv[sys.argv.index('--seed') + 1]) if '--seed' in sys.argv else None)
+    theGame.monitor_memory(memory)
+    if '--market' in sys.argv:
+        import farm_market
+        theGame.use_market(farm_market.Market())
     theGame.on_execute()
-
+    if '--sql-log' in sys.argv:
+        farm_sql.disable_diagnostics().save('sqlsession.json')
+        print("sql session saved, 'python farm_sql.py report' prints it")